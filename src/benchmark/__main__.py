@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+
+import argparse
+from datetime import datetime
+import json
+import platform
+import subprocess
+import sys
+from timeit import default_timer
+
+from benchmark import cases
+
+def case_run(name, case, repeat):
+    """Run a case repeatedly and report the best time to minimize noise."""
+    timings = []
+    for _ in range(repeat):
+        prepare = case()
+        start = default_timer()
+        prepare()
+        timings.append(default_timer() - start)
+
+    return {
+        'best': min(timings),
+        'mean': sum(timings) / len(timings),
+        'timings': timings,
+    }
+
+def commit_current():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(args):
+    names = args.case or sorted(cases.CASES)
+    for name in names:
+        if name not in cases.CASES:
+            print('unknown case {}'.format(name))
+            return 1
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r') as handle:
+            baseline = json.load(handle)['cases']
+
+    results = {
+        'commit': commit_current(),
+        'python': platform.python_version(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'cases': {},
+    }
+    for name in names:
+        result = results['cases'][name] = case_run(name, cases.CASES[name], args.repeat)
+
+        line = '{:<34} best {:.4f}s of {}'.format(name, result['best'], args.repeat)
+        if name in baseline:
+            line += ' ({:.2f}x of {:.4f}s)'.format(result['best'] / baseline[name]['best'], baseline[name]['best'])
+        print(line)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark hot paths against synthetic data.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('case',
+                        nargs='*',
+                        help='cases to run (default all)')
+    parser.add_argument('-c', '--compare',
+                        metavar='PATH',
+                        help='JSON results of previous run to compare against')
+    parser.add_argument('-o', '--output',
+                        metavar='PATH',
+                        help='write JSON results')
+    parser.add_argument('-r', '--repeat',
+                        type=int,
+                        default=3,
+                        help='number of times to run each case')
+
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,191 @@
+import atexit
+from benchmark import generate
+from copy import deepcopy
+import logging
+from tempfile import mkdtemp
+from tempfile import TemporaryDirectory
+
+CASES = {}
+MEMO = {}
+
+# Scale of synthetic data roughly matching the full history.
+RELEASE_COUNT = 2000
+BUG_COUNT = 100000
+MBOX_MONTHS = generate.months_generate((2020, 6), 12)
+SNAPSHOT_RELEASE_COUNT = 60
+FUZZY_THRESHOLD = 0.6
+
+def case(name):
+    """Register a case which prepares data and returns the callable to time."""
+    def register(function):
+        CASES[name] = function
+        return function
+    return register
+
+def memoize(key, function, *args):
+    """Generate data once per process as it is shared between cases."""
+    if key not in MEMO:
+        MEMO[key] = function(*args)
+    return MEMO[key]
+
+def temp_dir():
+    """Create a directory under a root removed once the process exits."""
+    if 'temp_root' not in MEMO:
+        root = MEMO['temp_root'] = TemporaryDirectory(prefix='tumbleweed-review-benchmark-')
+        atexit.register(root.cleanup)
+    return mkdtemp(dir=MEMO['temp_root'].name)
+
+def logger_init(*modules):
+    for module in modules:
+        module.logger = logging.getLogger()
+
+def releases():
+    return memoize('releases', generate.releases_generate, RELEASE_COUNT)
+
+def mail_tree():
+    import mail
+
+    logger_init(mail)
+    mbox_paths = memoize('mboxes', lambda: generate.mboxes_generate(temp_dir(), MBOX_MONTHS))
+    return memoize('tree', mail.mboxes_process, mbox_paths)
+
+def site_data():
+    return memoize('site', lambda: (
+        generate.bugs_release_generate(releases()), generate.mail_export_generate(releases()),
+        generate.scores_generate(releases()), generate.snapshot_details_generate(releases())))
+
+@case('bug_release_associate')
+def bug_release_associate():
+    from bug import bug_release_associate
+
+    bugs = memoize('bugs', generate.bugs_generate, BUG_COUNT, releases())
+    return lambda: bug_release_associate(bugs, releases())
+
+@case('bug_release_associate_incremental')
+def bug_release_associate_incremental():
+    from bug import bug_release_associate
+
+    bugs = memoize('bugs', generate.bugs_generate, BUG_COUNT, releases())
+    bugs_release = deepcopy(memoize('bugs_release', bug_release_associate, bugs, releases()))
+    bugs_changed = generate.bugs_generate(500, releases(), seed=1)
+    return lambda: bug_release_associate(bugs_changed, releases(), bugs_release)
+
+@case('mboxes_process')
+def mboxes_process():
+    import mail
+
+    logger_init(mail)
+    mbox_paths = memoize('mboxes', lambda: generate.mboxes_generate(temp_dir(), MBOX_MONTHS))
+    return lambda: mail.mboxes_process(mbox_paths)
+
+@case('mboxes_process_scan_bodies')
+def mboxes_process_scan_bodies():
+    import mail
+
+    logger_init(mail)
+    mbox_paths = memoize('mboxes', lambda: generate.mboxes_generate(temp_dir(), MBOX_MONTHS))
+    return lambda: mail.mboxes_process(mbox_paths, scan_bodies=True)
+
+@case('discussions_find')
+def discussions_find():
+    import mail
+
+    root, lookup, releases = mail_tree()
+    return lambda: mail.discussions_find(root, lookup, releases)
+
+@case('discussions_reduce')
+def discussions_reduce():
+    import mail
+
+    root, lookup, releases = mail_tree()
+    discussions = mail.discussions_find(root, lookup, releases)
+    return lambda: mail.discussions_reduce(discussions)
+
+@case('discussions_reduce_fuzzy')
+def discussions_reduce_fuzzy():
+    import mail
+
+    root, lookup, releases = mail_tree()
+    discussions = mail.discussions_find(root, lookup, releases)
+    return lambda: mail.discussions_reduce(discussions, FUZZY_THRESHOLD)
+
+@case('discussions_export')
+def discussions_export():
+    import mail
+
+    root, lookup, releases = mail_tree()
+    discussions = mail.discussions_reduce(mail.discussions_find(root, lookup, releases))
+    return lambda: dict(mail.discussions_export(lookup, releases, discussions))
+
+@case('subject_reduce')
+def subject_reduce():
+    import mail
+
+    root, lookup, releases = mail_tree()
+    discussions = mail.discussions_find(root, lookup, releases)
+    messages = [(node.message, release) for release, nodes in discussions.items() for node in nodes]
+    # Repeat to amount to a meaningful duration.
+    messages = messages * max(1, 20000 // max(len(messages), 1))
+    return lambda: [mail.subject_reduce(message, release) for message, release in messages]
+
+@case('list_detail_download')
+def list_detail_download():
+    import snapshot
+
+    logger_init(snapshot)
+    snapshot_releases = releases()[-SNAPSHOT_RELEASE_COUNT:]
+    cache_dir = memoize('snapshot_files', temp_dir)
+    memoize('snapshot_files_generate', generate.snapshot_files_generate, cache_dir, snapshot_releases)
+    return lambda: dict(snapshot.list_detail_download(cache_dir, snapshot_releases))
+
+@case('binaries_shared_update')
+def binaries_shared_update():
+    import snapshot
+
+    logger_init(snapshot)
+    snapshot_releases = releases()[-SNAPSHOT_RELEASE_COUNT:]
+    cache_dir = memoize('snapshot_files', temp_dir)
+    memoize('snapshot_files_generate', generate.snapshot_files_generate, cache_dir, snapshot_releases)
+    details = {release: {} for release in snapshot_releases}
+    return lambda: snapshot.binaries_shared_update(cache_dir, snapshot_releases, details, len(snapshot_releases))
+
+@case('score')
+def score():
+    import score
+
+    bug, mail, _, snapshot = site_data()
+    return lambda: score.score(bug, mail, snapshot)
+
+@case('score_incremental')
+def score_incremental():
+    import score
+
+    logger_init(score)
+    bug, mail, _, snapshot = site_data()
+    chain, scores = memoize('chain', score.score_incremental, bug, mail, snapshot, {}, {})
+    chain = deepcopy(chain)
+    mail = deepcopy(mail)
+    mail[releases()[-100]]['threads'].append({'reference_count': 10})
+    return lambda: score.score_incremental(bug, mail, snapshot, chain, scores)
+
+@case('score_sweep')
+def score_sweep():
+    import score
+
+    factors = score.factors_build(*(site_data()[i] for i in [0, 1, 3]))
+    return lambda: score.sweep(factors, score.SWEEP_GRID, releases()[::40])
+
+def posts_build_case(jobs):
+    import markdown
+
+    logger_init(markdown)
+    posts_dir = temp_dir()
+    return lambda: markdown.posts_build(posts_dir, *site_data(), jobs=jobs)
+
+@case('posts_build')
+def posts_build():
+    return posts_build_case(None)
+
+@case('posts_build_serial')
+def posts_build_serial():
+    return posts_build_case(1)
@@ -0,0 +1,266 @@
+from datetime import date
+from datetime import timedelta
+import mailbox
+import os
+from os import path
+import random
+
+STATUSES = ['NEW', 'CONFIRMED', 'IN_PROGRESS', 'RESOLVED', 'REOPENED']
+RESOLUTIONS = ['FIXED', 'INVALID', 'WONTFIX', 'DUPLICATE', 'WORKSFORME']
+COMPONENTS = ['Basesystem', 'KDE Workspace (Plasma)', 'GNOME', 'Kernel', 'X.Org', 'Installation', 'Network']
+WORDS = ['plasma', 'crash', 'login', 'kernel', 'panic', 'boot', 'fails', 'mesa', 'black', 'screen',
+         'after', 'update', 'wayland', 'network', 'missing', 'dependency', 'broken', 'segfault']
+
+PACKAGES = ['kernel-source', 'gcc', 'gcc10', 'gcc11', 'gcc12', 'gcc7', 'Mesa', 'llvm', 'xorg-x11-server',
+            'xwayland', 'plasma5-workspace', 'plasma-framework', 'kate', 'gtk3-devel', 'gnome-builder']
+ARCHES = ['x86_64', 'noarch', 'i586']
+
+def releases_generate(count, start=date(2016, 1, 1)):
+    """Generate YYYYMMDD releases roughly every other day."""
+    rand = random.Random(count)
+    releases = []
+    day = start
+    for _ in range(count):
+        releases.append(day.strftime('%Y%m%d'))
+        day += timedelta(days=rand.randint(1, 3))
+    return releases
+
+def bugs_generate(count, releases, seed=0):
+    """Generate bug info dictionaries created across the release range in random order."""
+    rand = random.Random(seed)
+    start = date(*map(int, (releases[0][0:4], releases[0][4:6], releases[0][6:8])))
+    end = date(*map(int, (releases[-1][0:4], releases[-1][4:6], releases[-1][6:8])))
+    span = (end - start).days + 7
+
+    bugs = []
+    for bug_id in rand.sample(range(1000000, 1000000 + count * 4), count):
+        created = start + timedelta(days=rand.randrange(-7, span))
+        status = rand.choice(STATUSES)
+        bugs.append({
+            'component': rand.choice(COMPONENTS),
+            'create_time': '{}T{:02d}:{:02d}:{:02d}'.format(
+                created.strftime('%Y%m%d'), rand.randrange(24), rand.randrange(60), rand.randrange(60)),
+            'id': bug_id,
+            'resolution': rand.choice(RESOLUTIONS) if status == 'RESOLVED' else '',
+            'status': status,
+            'summary': ' '.join(rand.choice(WORDS) for _ in range(rand.randint(3, 9))),
+        })
+
+    return bugs
+
+def mail_export_generate(releases, seed=0):
+    """Generate mail.yaml structured data with threads spanning the migration."""
+    rand = random.Random(seed)
+    export = {}
+    for release in releases:
+        month = '{}-{}'.format(release[0:4], release[4:6])
+        message_number = rand.randrange(4000)
+        export[release] = {
+            'announcement': '{}.{}::<announce-{}@example.com>'.format(month, message_number, release),
+            'reference_count': 0,
+            'thread_count': 0,
+            'threads': [],
+        }
+
+        for thread_index in range(rand.choice([0, 0, 1, 1, 2, 3, 5, 8])):
+            thread = {
+                'reference_count': 0,
+                'summary': ' '.join(rand.choice(WORDS) for _ in range(rand.randint(2, 6))),
+                'messages': [],
+            }
+            for message_index in range(rand.choice([1, 1, 1, 2, 3])):
+                reference_count = rand.randint(1, 40)
+                thread['messages'].append('{}.{}::<{}.{}.{}@example.com>'.format(
+                    month, rand.randrange(4000), release, thread_index, message_index))
+                thread['reference_count'] += reference_count
+            export[release]['threads'].append(thread)
+            export[release]['reference_count'] += thread['reference_count']
+            export[release]['thread_count'] += 1
+
+    return export
+
+def snapshot_details_generate(releases, seed=0):
+    """Generate snapshot.yaml structured data for most releases."""
+    rand = random.Random(seed)
+    details = {}
+    for release in releases:
+        if rand.random() < 0.1:
+            continue
+
+        binary_interest = {
+            'Mesa': '21.{}.{}'.format(rand.randint(0, 3), rand.randint(0, 4)),
+            'gcc': '11',
+            'kernel-source': '5.{}.{}'.format(rand.randint(0, 19), rand.randint(0, 12)),
+        }
+        details[release] = {
+            'binary_count': rand.randint(40000, 60000),
+            'binary_interest': binary_interest,
+            'binary_interest_changed': sorted(rand.sample(sorted(binary_interest), rand.randint(0, 2))),
+            'binary_unique_count': rand.randint(100, 20000),
+            'disk_base': '{:.1f}GiB'.format(rand.uniform(30, 60)),
+        }
+        shared = details[release]['binary_count'] - details[release]['binary_unique_count']
+        details[release]['binary_shared_count'] = shared
+        details[release]['disk_shared'] = '{:.1f}%'.format(100 * shared / details[release]['binary_count'])
+
+    return details
+
+def bugs_release_generate(releases, seed=0):
+    """Generate bug.yaml structured data by associating synthetic bugs."""
+    from bug import bug_release_associate
+    return bug_release_associate(bugs_generate(len(releases) * 5, releases, seed), releases)
+
+def scores_generate(releases, seed=0):
+    rand = random.Random(seed)
+    return {release: {'score': rand.randint(40, 100), 'stability_level': rand.choice(['stable', 'moderate', 'unstable'])}
+            for release in releases}
+
+def months_generate(start, count):
+    """Generate (year, month) tuples of count months from start."""
+    months = []
+    year, month = start
+    for _ in range(count):
+        months.append(('{:04d}'.format(year), '{:02d}'.format(month)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+def mboxes_generate(directory, months, messages_per_month=600, seed=0):
+    """Write mboxes with threads of replies spanning months.
+
+    Mimics header quirks of the mailing list before and after the migration:
+    the subject prefix, in-reply-to stripped of <>, and mail lacking headers.
+    """
+    from mail import MAILING_LIST
+    from mail import MAILBOX_PATH
+    from mail import MIGRATION_MONTH
+    from mail import MIGRATION_YEAR
+
+    rand = random.Random(seed)
+    threads = []
+    releases = []
+    mbox_paths = []
+    for year, month in months:
+        migrated = (int(year), int(month)) > (MIGRATION_YEAR, MIGRATION_MONTH)
+        prefix = '' if migrated else '[{}] '.format(MAILING_LIST)
+        mbox_path = path.join(directory, MAILBOX_PATH.format(list=MAILING_LIST, year=year, month=month))
+        if path.exists(mbox_path):
+            os.remove(mbox_path)
+        mbox = mailbox.mbox(mbox_path)
+
+        day = 1
+        for number in range(messages_per_month):
+            message = mailbox.mboxMessage()
+            message.set_from('{}@example.com'.format(rand.choice(WORDS)))
+            message_id = '<{}.{}.{}@example.com>'.format(year + month, number, rand.randrange(1 << 30))
+
+            choice = rand.random()
+            if not threads or (choice < 0.03 and day < 28):
+                # Release announcement.
+                day += 1
+                release = '{}{}{:02d}'.format(year, month, day)
+                releases.append(release)
+                subject = '{}New Tumbleweed snapshot {} released!'.format(prefix, release)
+                threads.append({'subject': subject, 'messages': [message_id]})
+            elif choice < 0.04 and releases:
+                # Report only mentioning the release in the body.
+                subject = '{}{}'.format(prefix, ' '.join(rand.choice(WORDS) for _ in range(rand.randint(2, 5))))
+                threads.append({'subject': subject, 'messages': [message_id]})
+            elif choice < 0.12 and releases:
+                # Discussion referencing a recent release.
+                subject = '{}{} after updating to {}'.format(
+                    prefix, ' '.join(rand.choice(WORDS) for _ in range(rand.randint(2, 5))), rand.choice(releases[-5:]))
+                threads.append({'subject': subject, 'messages': [message_id]})
+            else:
+                # Reply favoring recent threads and the deepest message.
+                thread = threads[-rand.randint(1, min(len(threads), 30))]
+                if rand.random() < 0.7:
+                    parent = thread['messages'][-1]
+                else:
+                    parent = rand.choice(thread['messages'])
+                subject = 'Re: ' + thread['subject'].replace(prefix, '', 1)
+                if prefix and rand.random() < 0.5:
+                    subject = 'Re: ' + thread['subject']
+                if rand.random() < 0.05:
+                    subject = subject[:20] + '\n ' + subject[20:]
+
+                references = thread['messages'][-rand.randint(1, 5):]
+                if migrated:
+                    parent = parent.strip('<>')
+                message['In-Reply-To'] = parent
+                message['References'] = ' '.join(references)
+                thread['messages'].append(message_id)
+
+            if migrated and rand.random() < 0.01:
+                # Dead mail lacking a message-id.
+                message['Subject'] = subject
+            else:
+                message['Message-ID'] = message_id
+                message['Subject'] = subject
+            body = ' '.join(rand.choice(WORDS) for _ in range(rand.randint(5, 60)))
+            if releases and (choice < 0.04 or rand.random() < 0.2):
+                # Release mentioned only in the body or in a quoted reply.
+                quote = '> ' if rand.random() < 0.5 else ''
+                body = '{}since updating to {}\n{}'.format(quote, rand.choice(releases[-5:]), body)
+            if rand.random() < 0.02:
+                # Attachment of which the encoded content may resemble a release.
+                message['Content-Type'] = 'multipart/mixed; boundary="part"'
+                body = ('--part\nContent-Type: text/plain\n\n{}\n--part\nContent-Type: application/octet-stream\n'
+                        'Content-Transfer-Encoding: base64\n\nMjAx {}\n--part--').format(body, rand.choice(releases or ['0']))
+            message.set_payload('{}\n'.format(body))
+            mbox.add(message)
+
+        mbox.flush()
+        mbox.close()
+        mbox_paths.append((mbox_path, (year, month)))
+
+    return mbox_paths
+
+def snapshot_files_generate(cache_dir, releases, binary_count=20000, seed=0):
+    """Write disk, rpm.list, and rpm.unique.list files in request cache layout."""
+    from snapshot import SNAPSHOT_BASEURL
+    from snapshot import snapshot_url
+    from util.common import request_cached_path
+
+    rand = random.Random(seed)
+    names = PACKAGES + ['package-{}'.format(index) for index in range(binary_count - len(PACKAGES))]
+    arches = {name: rand.choice(ARCHES) for name in names}
+    versions = {name: [rand.randint(1, 30), rand.randint(0, 20), rand.randint(0, 5)] for name in names}
+    for name in names:
+        if name.startswith('gcc'):
+            # The gcc package versions are major only.
+            versions[name] = [int(name[3:] or 11)]
+    build = dict.fromkeys(names, 1)
+
+    for release in releases:
+        release_dir = path.dirname(request_cached_path(snapshot_url(release, 'disk'), cache_dir))
+        os.makedirs(release_dir, exist_ok=True)
+
+        unique = set(rand.sample(names, int(binary_count * rand.uniform(0.01, 0.4))))
+        for name in unique:
+            if len(versions[name]) == 3 and rand.random() < 0.3:
+                versions[name][2] += 1
+            build[name] += 1
+
+        lines = []
+        lines_unique = []
+        for name in names:
+            line = 'repo::{0}/{1}-{2}-{3}.1.{0}.rpm'.format(
+                arches[name], name, '.'.join(map(str, versions[name])), build[name])
+            lines.append(line)
+            if name in unique:
+                lines_unique.append(line)
+
+        with open(path.join(release_dir, 'rpm.list'), 'w') as handle:
+            handle.write('\n'.join(lines) + '\n')
+        with open(path.join(release_dir, 'rpm.unique.list'), 'w') as handle:
+            handle.write('\n'.join(lines_unique) + '\n')
+        with open(path.join(release_dir, 'disk'), 'w') as handle:
+            if rand.random() < 0.02:
+                # Pending snapshot.
+                continue
+            handle.write('{}\t/srv/history/{}\n{} unique\n'.format(
+                rand.randint(30, 60) * 1024 ** 3, release, len(unique)))
+
+    list_path = request_cached_path(SNAPSHOT_BASEURL + 'list', cache_dir)
+    with open(list_path, 'w') as handle:
+        handle.write('\n'.join(releases) + '\n')
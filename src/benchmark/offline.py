@@ -0,0 +1,314 @@
+#!/usr/bin/python3
+
+import argparse
+from datetime import date
+from datetime import datetime
+import gzip
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+import json
+import mailbox
+import os
+from os import path
+import platform
+import random
+import re
+import shutil
+import socketserver
+import subprocess
+import sys
+from tempfile import mkdtemp
+import threading
+import time
+from timeit import default_timer
+from urllib.parse import urlparse
+from xmlrpc.client import DateTime
+from xmlrpc.server import SimpleXMLRPCRequestHandler
+from xmlrpc.server import SimpleXMLRPCServer
+
+from benchmark import generate
+from benchmark.__main__ import commit_current
+
+SCRIPT_PATH = path.normpath(path.join(path.dirname(path.realpath(__file__)), '..'))
+RELEASE_ANNOUNCEMENT = re.compile(r'^(?:\[[^]]+\] )?New Tumbleweed snapshot (\d{8}) released')
+REPO_NAME = 'tumbleweed-review-site.git'
+GIT_SYNC_NAME = 'git-sync.git'
+
+# Stand-in for git-sync which commits all changes and pushes them.
+GIT_SYNC_SCRIPT = '''#!/bin/sh
+set -e
+git add -A
+git diff --cached --quiet || git commit -q -m "$(git config branch.master.syncCommitMsg || echo sync)"
+git pull -q --rebase origin master
+git push -q origin master
+'''
+
+GIT_ENV = {
+    'GIT_AUTHOR_EMAIL': 'benchmark@example.com',
+    'GIT_AUTHOR_NAME': 'benchmark',
+    'GIT_COMMITTER_EMAIL': 'benchmark@example.com',
+    'GIT_COMMITTER_NAME': 'benchmark',
+}
+
+def months_recent(count):
+    """Months ending with the current month as ingest always runs until today."""
+    today = date.today()
+    year, month = today.year, today.month - count + 1
+    while month < 1:
+        year, month = year - 1, month + 12
+    return generate.months_generate((year, month), count)
+
+def mboxes_publish(root, months, messages_per_month):
+    """Generate gzipped mboxes at the URL paths requested by mail ingest."""
+    import mail
+
+    mbox_dir = mkdtemp(dir=root)
+    releases = []
+    for mbox_path, (year, month) in generate.mboxes_generate(mbox_dir, months, messages_per_month):
+        mbox_url = mail.mboxes_download_url(date(int(year), int(month), 1), year, month)
+        publish_path = path.join(root, urlparse(mbox_url).path[1:])
+        os.makedirs(path.dirname(publish_path), exist_ok=True)
+        with open(mbox_path, 'rb') as mbox_file, gzip.open(publish_path, 'wb') as mbox_gzip:
+            shutil.copyfileobj(mbox_file, mbox_gzip)
+
+        for message in mailbox.mbox(mbox_path):
+            match = RELEASE_ANNOUNCEMENT.match(str(message['Subject']))
+            if match:
+                releases.append(match.group(1))
+
+    shutil.rmtree(mbox_dir)
+    return releases
+
+def bugs_prepare(count, releases, seed=0):
+    """Generate bugs including a last change time and comments."""
+    rand = random.Random(seed)
+    today = date.today().strftime('%Y%m%d')
+    bugs = generate.bugs_generate(count, releases, seed)
+    for bug in bugs:
+        bug['last_change_time'] = min(bug['create_time'][:8], today) + bug['create_time'][8:]
+        bug['comments'] = [{'text': 'Still happens on {}'.format(rand.choice(releases))}
+                           for _ in range(rand.randint(0, 3))]
+    return bugs
+
+def throttle_handler(root, latency, bandwidth):
+    """Build a static file handler delaying responses and limiting bandwidth."""
+    class ThrottleHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=root, **kwargs)
+
+        def send_head(self):
+            time.sleep(latency)
+            return super().send_head()
+
+        def copyfile(self, source, outputfile):
+            chunk_size = 64 * 1024
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                outputfile.write(chunk)
+                if bandwidth:
+                    time.sleep(len(chunk) / bandwidth)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ThrottleHandler
+
+class BugzillaFake:
+    """Bugzilla XML-RPC methods used by python-bugzilla for bug ingest."""
+    def __init__(self, bugs, latency):
+        self.bugs = bugs
+        self.latency = latency
+
+    def _dispatch(self, method, params):
+        time.sleep(self.latency)
+        if method == 'Bugzilla.version':
+            return {'version': '5.0'}
+        if method == 'User.get':
+            return {'users': [{'id': 1, 'name': 'benchmark'}]}
+        if method == 'Bug.search':
+            return {'bugs': self.search(params[0])}
+        if method == 'Bug.comments':
+            return {'bugs': self.comments(params[0]['ids']), 'comments': {}}
+        raise Exception('method "{}" is not supported'.format(method))
+
+    def search(self, query):
+        # Bug.search treats creation_time and last_change_time as minimums.
+        created = str(query.get('creation_time', '')).replace('-', '')
+        changed = str(query.get('last_change_time', '')).replace('-', '')
+        bugs = []
+        for bug in self.bugs:
+            if bug['create_time'] < created or bug['last_change_time'] < changed:
+                continue
+
+            bugs.append({
+                'component': bug['component'],
+                'creation_time': DateTime(bug['create_time']),
+                'id': bug['id'],
+                'last_change_time': DateTime(bug['last_change_time']),
+                'resolution': bug['resolution'],
+                'status': bug['status'],
+                'summary': bug['summary'],
+            })
+
+        return bugs
+
+    def comments(self, bug_ids):
+        lookup = {bug['id']: bug for bug in self.bugs}
+        return {str(bug_id): {'comments': lookup[int(bug_id)]['comments']} for bug_id in bug_ids}
+
+class ThreadingXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+class BugzillaRequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc.cgi',)
+
+    def log_message(self, format, *args):
+        pass
+
+def server_start(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return 'http://{}:{}/'.format(*server.server_address[:2])
+
+def git(directory, *args):
+    subprocess.check_call(['git'] + list(args), cwd=directory, env=dict(os.environ, **GIT_ENV),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def git_remotes_init(root):
+    """Create a bare site repository seeded with a commit and a git-sync stand-in."""
+    remotes = {}
+    for name, files in [(REPO_NAME, {'README.md': 'Site\n'}), (GIT_SYNC_NAME, {'git-sync': GIT_SYNC_SCRIPT})]:
+        work_dir = mkdtemp(dir=root)
+        remote = remotes[name] = path.join(root, name)
+        git(root, 'init', '-q', '--bare', '-b', 'master', remote)
+        git(work_dir, 'init', '-q', '-b', 'master')
+        for file_name, content in files.items():
+            with open(path.join(work_dir, file_name), 'w') as handle:
+                handle.write(content)
+            os.chmod(path.join(work_dir, file_name), 0o755)
+        git(work_dir, 'add', '-A')
+        git(work_dir, 'commit', '-q', '-m', 'Initial commit')
+        git(work_dir, 'push', '-q', remote, 'master')
+        shutil.rmtree(work_dir)
+
+    return remotes
+
+def pipeline_run(cache_dir, urls, remotes, start_month, scan_comments):
+    """Run all stages end to end and return the duration."""
+    command = [
+        sys.executable, path.join(SCRIPT_PATH, 'main.py'),
+        '--bugzilla-baseurl', urls['bugzilla'],
+        '--cache-dir', cache_dir,
+        '--git-sync-url', remotes[GIT_SYNC_NAME],
+        '--mailbox-baseurl', urls['static'],
+        '--repo-url', remotes[REPO_NAME],
+        '--snapshot-baseurl', urls['static'] + 'history/',
+        'all',
+        '--bugzilla-apiurl', urls['bugzilla'] + 'xmlrpc.cgi',
+        '--bug-start-month', start_month,
+        '--start-month', start_month,
+    ]
+    if scan_comments:
+        command.append('--scan-comments')
+
+    env = dict(os.environ, **GIT_ENV)
+    start = default_timer()
+    result = subprocess.run(command, env=env, cwd=SCRIPT_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    duration = default_timer() - start
+    if result.returncode != 0:
+        raise Exception('run failed:\n{}'.format(result.stderr.decode('utf-8')))
+
+    return duration
+
+def main(args):
+    root = mkdtemp(prefix='tumbleweed-review-offline-')
+    try:
+        return offline_run(args, root)
+    finally:
+        if args.keep:
+            print('kept {}'.format(root))
+        else:
+            shutil.rmtree(root)
+
+def offline_run(args, root):
+    static_dir = path.join(root, 'static')
+    cache_dir = path.join(root, 'cache')
+    os.makedirs(static_dir)
+    os.makedirs(cache_dir)
+
+    print('generating fixtures in {}'.format(root))
+    months = months_recent(args.months)
+    releases = mboxes_publish(static_dir, months, args.messages)
+    generate.snapshot_files_generate(static_dir, releases, args.binaries)
+    bugs = bugs_prepare(args.bugs, releases)
+    remotes = git_remotes_init(root)
+
+    bandwidth = args.bandwidth * 1024
+    bugzilla_server = ThreadingXMLRPCServer(
+        ('127.0.0.1', 0), BugzillaRequestHandler, allow_none=True, logRequests=False)
+    bugzilla_server.register_instance(BugzillaFake(bugs, args.latency))
+    urls = {
+        'bugzilla': server_start(bugzilla_server),
+        'static': server_start(ThreadingHTTPServer(
+            ('127.0.0.1', 0), throttle_handler(static_dir, args.latency, bandwidth))),
+    }
+
+    results = {
+        'commit': commit_current(),
+        'python': platform.python_version(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'cases': {},
+    }
+    start_month = '{}-{}'.format(*months[0])
+    for name in ['all_cold', 'all_warm']:
+        duration = pipeline_run(cache_dir, urls, remotes, start_month, args.scan_comments)
+        results['cases'][name] = {'best': duration, 'mean': duration, 'timings': [duration]}
+        print('{:<34} {:.4f}s'.format(name, duration))
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2, sort_keys=True)
+
+    return 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time cold and warm runs of all stages against local fixtures and remotes.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--bandwidth',
+                        type=int,
+                        default=0,
+                        help='KiB/s served per response (0 for unlimited)')
+    parser.add_argument('--binaries',
+                        type=int,
+                        default=5000,
+                        help='binaries per snapshot')
+    parser.add_argument('--bugs',
+                        type=int,
+                        default=2000,
+                        help='bugs served by the fake bugzilla')
+    parser.add_argument('-k', '--keep',
+                        action='store_true',
+                        help='keep fixtures, cache, and remotes')
+    parser.add_argument('-l', '--latency',
+                        type=float,
+                        default=0.05,
+                        help='seconds of delay per request')
+    parser.add_argument('-m', '--months',
+                        type=int,
+                        default=6,
+                        help='months of mail ending with the current month')
+    parser.add_argument('--messages',
+                        type=int,
+                        default=300,
+                        help='messages per month')
+    parser.add_argument('-o', '--output',
+                        metavar='PATH',
+                        help='write JSON results')
+    parser.add_argument('--scan-comments',
+                        action='store_true',
+                        help='include scanning bug comments')
+
+    sys.exit(main(parser.parse_args()))
@@ -1,14 +1,19 @@
+from bisect import bisect_right
 import bugzilla
+from concurrent.futures import ThreadPoolExecutor
 from mail import date_month_arg
 from os import path
+import re
 from urllib.parse import urljoin
 from util.common import ensure_directory
-from util.common import release_to_date
 from util.common import yaml_load
-import yaml
+from util.common import yaml_write
 
 BUGZILLA_BASEURL = 'https://bugzilla.opensuse.org/'
 BUGZILLA_PRODUCT = 'openSUSE Tumbleweed'
+COMMENT_BATCH_SIZE = 200
+COMMENT_WORKERS = 4
+RELEASE_MENTION_PATTERN = r'(?<!\d)20\d{6}(?!\d)'
 
 def bugzilla_url(bug_id):
     return urljoin(BUGZILLA_BASEURL, 'show_bug.cgi?id={}'.format(bug_id))
@@ -20,12 +25,25 @@ def bugzilla_init(apiurl):
         bugzilla_api.interactive_login()
     return bugzilla_api
 
-def bugzilla_query(bugzilla_api, start_month):
-    query = bugzilla_api.url_to_query(
-        'buglist.cgi?creation_time={}&product={}'.format(start_month, BUGZILLA_PRODUCT))
-    query['include_fields'] = ['component', 'creation_time', 'id', 'resolution', 'status', 'summary']
+def bugzilla_query(bugzilla_api, start_month, changed_since=None):
+    url = 'buglist.cgi?creation_time={}&product={}'.format(start_month, BUGZILLA_PRODUCT)
+    if changed_since:
+        url += '&last_change_time={}'.format(changed_since)
+    query = bugzilla_api.url_to_query(url)
+    query['include_fields'] = [
+        'component', 'creation_time', 'id', 'last_change_time', 'resolution', 'status', 'summary']
     return bugzilla_api.query(query)
 
+def bugs_fetch(bugzilla_api, start_month, changed_since=None):
+    """Fetch bug info keyed by id along with last change time of each."""
+    bugs = {}
+    last_change_times = {}
+    for bug in bugzilla_query(bugzilla_api, start_month, changed_since):
+        bugs[bug.id] = bug_info(bug)
+        last_change_times[bug.id] = str(bug.last_change_time)
+
+    return bugs, last_change_times
+
 def bug_info(bug):
     return {
         'component': bug.component,
@@ -36,32 +54,115 @@ def bug_info(bug):
         'summary': bug.summary,
     }
 
-def bug_release_associate(bugs, mail):
-    """Associate bugs with a release if they were created after it."""
-    bugs_release = {}
-
-    bugs_reversed = reversed(bugs) # Already in order, so start with newest.
-    bug_previous = None
-    for release in sorted(mail, reverse=True):
-        release_date = release_to_date(release)
+def bug_create_day(bug):
+    """Reduce bug creation time to YYYYMMDD for comparison against releases."""
+    return bug['create_time'].replace('-', '')[:8]
+
+def bug_release_find(releases, bug):
+    """Find the newest of the sorted releases on or before bug creation."""
+    index = bisect_right(releases, bug_create_day(bug)) - 1
+    return releases[index] if index >= 0 else None
+
+def bug_release_remove(bugs_release, bug_ids):
+    """Remove bugs from releases with which they are associated."""
+    for release, bug_release in bugs_release.items():
+        if any(bug['id'] in bug_ids for bug in bug_release):
+            bugs_release[release] = [bug for bug in bug_release if bug['id'] not in bug_ids]
+
+def bug_release_associate(bugs, releases, bugs_release=None):
+    """Associate bugs with a release if they were created after it.
+
+    Bugs are also associated with any releases they explicitly mention. Bugs
+    may be provided in any order. When a previous association is provided
+    only the given bugs are (re-)associated and the remainder is left intact.
+    """
+    bugs = list(bugs)
+    releases = sorted(releases)
+    if bugs_release is None:
+        bugs_release = {}
+    else:
+        # Drop previous association of bugs that will be re-associated.
+        bug_release_remove(bugs_release, set(bug['id'] for bug in bugs))
+
+    for release in releases:
         bugs_release.setdefault(release, [])
 
-        if bug_previous:
-            if bug.creation_time >= release_date:
-                bugs_release[release].append(bug_info(bug))
-            else:
-                continue
+    releases_touched = set()
+    for bug in bugs:
+        release = bug_release_find(releases, bug)
+        if release:
+            bugs_release[release].append(bug)
+            releases_touched.add(release)
+
+        # Explicitly mentioned releases are linked in addition to creation.
+        for release_mentioned in bug.get('releases_mentioned', []):
+            if release_mentioned != release and release_mentioned in bugs_release:
+                # Copy to avoid aliases when dumped.
+                bugs_release[release_mentioned].append(
+                    dict(bug, releases_mentioned=list(bug['releases_mentioned'])))
+                releases_touched.add(release_mentioned)
 
-        for bug in bugs_reversed:
-            if bug.creation_time >= release_date:
-                bugs_release[release].append(bug_info(bug))
-            else:
-                bug_previous = bug
-                break
+    for release in releases_touched:
+        bugs_release[release].sort(key=lambda b: b['id'])
 
     return bugs_release
 
-def main(logger_, cache_dir, data_dir, bugzilla_apiurl, start_month):
+def bug_cache_diff(bugs_cached, bugs):
+    """Determine bugs that are new or changed compared to the cache."""
+    bugs_changed = []
+    for bug_id, bug in bugs.items():
+        if bugs_cached.get(bug_id) != bug:
+            bugs_changed.append(bug)
+
+    return bugs_changed
+
+def comment_scan(comments, release_pattern):
+    """Scan comments for anything resembling a release."""
+    mentions = set()
+    for comment in comments:
+        mentions.update(release_pattern.findall(comment['text']))
+
+    return sorted(mentions)
+
+def comment_fetch(bugzilla_api, bug_ids):
+    """Fetch comments for a batch of bugs keyed by bug id."""
+    comments = bugzilla_api.get_comments(bug_ids)['bugs']
+    return {int(bug_id): bug_comments['comments'] for bug_id, bug_comments in comments.items()}
+
+def comments_scan(bugzilla_api, cache_dir, bugs, last_change_times, releases):
+    """Add releases mentioned in comments to bugs using cache where unchanged.
+
+    Comments are only fetched for bugs changed since cached and are fetched in
+    batches by a bounded pool of workers.
+    """
+    comment_cache = yaml_load(cache_dir, 'comment.yaml') or {}
+    release_pattern = re.compile(RELEASE_MENTION_PATTERN)
+    releases = set(releases)
+
+    bug_ids = sorted(bug_id for bug_id in bugs
+                     if comment_cache.get(bug_id, {}).get('last_change_time') != last_change_times[bug_id])
+    batches = [bug_ids[i:i + COMMENT_BATCH_SIZE] for i in range(0, len(bug_ids), COMMENT_BATCH_SIZE)]
+    logger.info('fetching comments for %d bugs in %d batches', len(bug_ids), len(batches))
+
+    with ThreadPoolExecutor(max_workers=COMMENT_WORKERS) as executor:
+        for comments in executor.map(lambda batch: comment_fetch(bugzilla_api, batch), batches):
+            for bug_id, bug_comments in comments.items():
+                comment_cache[bug_id] = {
+                    'comment_count': len(bug_comments),
+                    'last_change_time': last_change_times[bug_id],
+                    'mentions': comment_scan(bug_comments, release_pattern),
+                }
+
+    for bug_id, bug in bugs.items():
+        mentions = set(release_pattern.findall(bug['summary']))
+        mentions.update(comment_cache.get(bug_id, {}).get('mentions', []))
+        mentions.intersection_update(releases)
+        if mentions:
+            bug['releases_mentioned'] = sorted(mentions)
+
+    yaml_write(cache_dir, 'comment.yaml', comment_cache)
+
+def main(logger_, cache_dir, data_dir, bugzilla_apiurl, start_month, scan_comments=False):
     global logger
     logger = logger_
 
@@ -69,29 +170,52 @@ def main(logger_, cache_dir, data_dir, bugzilla_apiurl, start_month):
     ensure_directory(data_dir)
 
     bugzilla_api = bugzilla_init(bugzilla_apiurl)
-    bugs = bugzilla_query(bugzilla_api, start_month)
+    bugs, last_change_times = bugs_fetch(bugzilla_api, start_month)
 
     mail = yaml_load(data_dir, 'mail.yaml')
-    bugs_release = bug_release_associate(bugs, mail)
-
-    with open(path.join(data_dir, 'bug.yaml'), 'w') as outfile:
-        yaml.safe_dump(bugs_release, outfile, default_flow_style=False)
+    if scan_comments:
+        comments_scan(bugzilla_api, cache_dir, bugs, last_change_times, mail)
+
+    bugs_cached = yaml_load(cache_dir, 'bug.yaml') or {}
+    bugs_release = yaml_load(data_dir, 'bug.yaml')
+
+    if bugs_release is not None and set(bugs_release) == set(mail):
+        # Releases are unchanged so only re-associate new, changed, or removed bugs.
+        bugs_changed = bug_cache_diff(bugs_cached, bugs)
+        bugs_removed = set(bugs_cached) - set(bugs)
+        bugs_release = bug_release_associate(bugs_changed, mail, bugs_release)
+        bug_release_remove(bugs_release, bugs_removed)
+        logger.debug('re-associated %d bugs and removed %d', len(bugs_changed), len(bugs_removed))
+    else:
+        bugs_release = bug_release_associate(bugs.values(), mail)
+
+    yaml_write(cache_dir, 'bug.yaml', bugs)
+    if not yaml_write(data_dir, 'bug.yaml', bugs_release):
+        logger.debug('bug associations unchanged')
 
 def argparse_main(args):
     cache_dir = path.join(args.cache_dir, 'bug')
     data_dir = path.join(args.output_dir, 'data')
-    main(args.logger, cache_dir, data_dir, args.bugzilla_apiurl, args.start_month)
+    main(args.logger, cache_dir, data_dir, args.bugzilla_apiurl, args.start_month,
+         args.scan_comments)
 
-def argparse_configure(subparsers):
-    parser = subparsers.add_parser(
-        'bug',
-        help='Ingest bug data from bugzilla.')
-    parser.set_defaults(func=argparse_main)
+def argparse_arguments(parser, start_month_flags=('-s', '--start-month')):
+    """Add bug ingest arguments to parser, shared by subcommands running it."""
     parser.add_argument('-b', '--bugzilla-apiurl',
                         required=True,
                         metavar='URL',
                         help='bugzilla API URL')
-    parser.add_argument('-s', '--start-month',
+    parser.add_argument('--scan-comments',
+                        action='store_true',
+                        help='link bugs to releases mentioned in comments')
+    parser.add_argument(*start_month_flags,
                         type=date_month_arg,
                         default='2017-12',
-                        help='Start month from which to ingest mboxes')
+                        help='Start month from which to ingest bugs')
+
+def argparse_configure(subparsers):
+    parser = subparsers.add_parser(
+        'bug',
+        help='Ingest bug data from bugzilla.')
+    parser.set_defaults(func=argparse_main)
+    argparse_arguments(parser)
@@ -0,0 +1,151 @@
+import argparse
+from hashlib import sha1
+import json
+import logging
+from os import path
+import requests
+import struct
+import sys
+from urllib.parse import urljoin
+from util.common import ensure_directory
+from util.common import file_write
+
+# Fixed-width record: release (YYYYMMDD), score, suffix maximum, and level.
+#
+# The suffix maximum is the highest final score of the record and all newer
+# records within the shard. It never increases from one record to the next
+# which allows the newest release with a minimum score to be found by binary
+# search. Scores of pending releases are excluded from the maximum.
+INDEX_RECORD = struct.Struct('<IhhBx')
+INDEX_HEAD = 'latest.json'
+INDEX_SCORE_NONE = -32768
+LEVELS = ['pending', 'stable', 'moderate', 'unstable', 'unknown']
+
+def index_records(scores):
+    """Group scores into records sharded by year including suffix maximum."""
+    shards = {}
+    for release, score_release in sorted(scores.items()):
+        # Clamp to the signed 16-bit range reserving the lowest value for none.
+        score = max(min(score_release['score'], 32767), INDEX_SCORE_NONE + 1)
+        shards.setdefault(release[0:4], []).append([release, score, score_release['stability_level']])
+
+    for records in shards.values():
+        score_max = INDEX_SCORE_NONE
+        for record in reversed(records):
+            if record[2] != 'pending':
+                score_max = max(score_max, record[1])
+            record.append(score_max)
+
+    return shards
+
+def index_encode(records):
+    return b''.join(INDEX_RECORD.pack(int(release), score, score_max, LEVELS.index(level))
+                    for release, score, level, score_max in records)
+
+def index_write(index_dir, name, content):
+    """Write content unless unchanged and return the ETag."""
+    file_write(path.join(index_dir, name), content)
+    return '"{}"'.format(sha1(content).hexdigest()[:16])
+
+def index_publish(index_dir, scores):
+    """Publish compact JSON and binary score shards per year and a head file."""
+    ensure_directory(index_dir)
+
+    head = {
+        'latest': None,
+        'record': INDEX_RECORD.format,
+        'shards': {},
+    }
+    for year, records in sorted(index_records(scores).items()):
+        content_json = json.dumps([record[:3] for record in records], separators=(',', ':')).encode('utf-8')
+        head['shards'][year] = {
+            'count': len(records),
+            'etag_bin': index_write(index_dir, '{}.bin'.format(year), index_encode(records)),
+            'etag_json': index_write(index_dir, '{}.json'.format(year), content_json),
+            'score_max': records[0][3],
+        }
+        head['latest'] = records[-1][:3]
+
+    index_write(index_dir, INDEX_HEAD, json.dumps(head, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+
+def index_fetch(location, name):
+    """Fetch an index file from a local directory or base URL."""
+    if location.startswith(('http://', 'https://')):
+        response = requests.get(urljoin(location.rstrip('/') + '/', name))
+        response.raise_for_status()
+        return response.content
+
+    with open(path.join(location, name), 'rb') as handle:
+        return handle.read()
+
+def index_shard_search(content, minimum):
+    """Binary search shard for index of newest record with minimum score."""
+    low, high = 0, len(content) // INDEX_RECORD.size
+    while low < high:
+        middle = (low + high) // 2
+        if INDEX_RECORD.unpack_from(content, middle * INDEX_RECORD.size)[2] >= minimum:
+            low = middle + 1
+        else:
+            high = middle
+
+    return low - 1
+
+def index_search(location, minimum):
+    """Find the newest final release with a score of at least minimum."""
+    head = json.loads(index_fetch(location, INDEX_HEAD))
+    for year, shard in sorted(head['shards'].items(), reverse=True):
+        if shard['score_max'] < minimum:
+            continue
+
+        content = index_fetch(location, '{}.bin'.format(year))
+        index = index_shard_search(content, minimum)
+        if index >= 0:
+            release, score, _, level = INDEX_RECORD.unpack_from(content, index * INDEX_RECORD.size)
+            return str(release), score, LEVELS[level]
+
+    return None
+
+def main(logger_, location, minimum):
+    global logger
+    logger = logger_
+
+    found = index_search(location, minimum)
+    if not found:
+        print('no release with a score of at least {}'.format(minimum))
+        return 1
+
+    print('{} <{} / {}>'.format(*found))
+
+def argparse_main(args):
+    location = args.location or path.join(args.output_dir, 'data', 'index')
+    return main(args.logger, location, args.minimum)
+
+def argparse_configure(subparsers):
+    parser = subparsers.add_parser(
+        'index',
+        help='Find newest release with a minimum score from the score index.')
+    parser.set_defaults(func=argparse_main)
+    parser.add_argument('-l', '--location',
+                        metavar='PATH_OR_URL',
+                        help='index directory or URL (default output directory)')
+    parser.add_argument('-m', '--minimum',
+                        type=int,
+                        default=90,
+                        help='minimum score')
+
+if __name__ == '__main__':
+    # Standalone as reading the index requires neither the site nor the caches.
+    parser = argparse.ArgumentParser(
+        description='Find newest release with a minimum score from the score index.')
+    parser.add_argument('location',
+                        metavar='PATH_OR_URL',
+                        help='index directory or URL')
+    parser.add_argument('minimum',
+                        type=int,
+                        nargs='?',
+                        default=90,
+                        help='minimum score (default %(default)s)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname).1s] %(message)s')
+    sys.exit(main(logging.getLogger(), args.location, args.minimum))
@@ -10,13 +10,15 @@ from hashlib import sha1
 import io
 import logging
 import mailbox
+import mmap
 import os
 from os import path
 import re
 import requests
 import shutil
 from util.common import ensure_directory
-import yaml
+from util.common import prefetch_ordered
+from util.common import yaml_write
 
 # openSUSE switched over to new mailing list system (see issue #9).
 MIGRATION_YEAR = 2020
@@ -26,13 +28,29 @@ MAILING_LIST = 'opensuse-factory'
 MAILING_LIST_SHORT = 'factory'
 MAILING_LIST_URL_PRE = 'https://lists.opensuse.org/{list}/{year}-{month}/msg{number:05d}.html'
 MAILING_LIST_URL_POST = 'https://lists.opensuse.org/archives/list/factory@lists.opensuse.org/thread/{hash}'
-MAILBOX_URL_PRE = 'https://lists.opensuse.org/{list}/{list}-{year}-{month}.mbox.gz'
-MAILBOX_URL_POST = 'https://lists.opensuse.org/archives/list/{list}@lists.opensuse.org/export/{list}@lists.opensuse.org-{year}-{month}.mbox.gz?start=2020-{month}-01&end={end_date}'
+MAILBOX_BASEURL = 'https://lists.opensuse.org/'
+MAILBOX_URL_PRE = '{baseurl}{list}/{list}-{year}-{month}.mbox.gz'
+MAILBOX_URL_POST = '{baseurl}archives/list/{list}@lists.opensuse.org/export/{list}@lists.opensuse.org-{year}-{month}.mbox.gz?start=2020-{month}-01&end={end_date}'
 MAILBOX_PATH='{list}-{year}-{month}.mbox'
+MAILBOX_WORKERS = 2
+MAILBOX_PREFETCH = 3
 RELEASE_PATTERN_PRE = r'^\[{list}\] New Tumbleweed snapshot (?P<version>\d+) released!$'
 RELEASE_PATTERN_POST = r'^New Tumbleweed snapshot (?P<version>\d+) released!$'
 RELEASE_PATTERN_SHORT = r'^New Tumbleweed snapshot (?P<version>\d+)( released!)?$'
 
+# Single pass over raw mbox bytes which consumes each message separator along
+# with its headers, quoted reply lines, and non-text parts up to the next MIME
+# boundary or message so only release mentions in original text remain.
+MENTION_PATTERN = re.compile(rb'''(?mx)
+    ^From\ (?P<headers>(?s:.*?))\n\n
+    |^>[^\n]*
+    |^(?i:Content-Type:(?![ \t]*(?:text|multipart)/))(?s:.*?)(?=^--|^From\ |\Z)
+    |(?<!\d)(?P<release>20\d{6})(?!\d)
+''')
+MENTION_SKIP_PATTERN = re.compile(rb'(?im)^Content-Type:(?![ \t]*(?:text|multipart)/)')
+SUMMARY_PLACEHOLDERS = ['failed to summarize', 'no summary given']
+SUMMARY_STOPWORDS = set(['a', 'after', 'an', 'and', 'at', 'for', 'in', 'is', 'of', 'on', 'the', 'to', 'when', 'with'])
+
 def month_generator(month_start):
     """Generate months from now backwards until and including start month."""
     month = date.today()
@@ -52,13 +70,14 @@ def mboxes_download_url(month_date, year, month):
     # Does not handle partial month split and parsing both mail boxes.
     if month_date.year > MIGRATION_YEAR or (month_date.year == MIGRATION_YEAR and month_date.month >= MIGRATION_MONTH):
         end_date = month_next_start(month_date)
-        return MAILBOX_URL_POST.format(list=MAILING_LIST_SHORT, year=year, month=month, end_date=end_date)
+        return MAILBOX_URL_POST.format(
+            baseurl=MAILBOX_BASEURL, list=MAILING_LIST_SHORT, year=year, month=month, end_date=end_date)
 
-    return MAILBOX_URL_PRE.format(list=MAILING_LIST, year=year, month=month)
+    return MAILBOX_URL_PRE.format(baseurl=MAILBOX_BASEURL, list=MAILING_LIST, year=year, month=month)
 
-def mboxes_download(cache_dir, month_start, refresh=True):
-    """Download mboxes for given month range."""
-    mbox_paths = {}
+def mboxes_plan(cache_dir, month_start, refresh=True):
+    """Determine mboxes for given month range and which require download."""
+    plan = []
     month_previous = None
     for month_date in month_generator(month_start):
         year = str(month_date.year)
@@ -73,7 +92,6 @@ def mboxes_download(cache_dir, month_start, refresh=True):
         mbox_url = mboxes_download_url(month_date, year, month)
         mbox_name = MAILBOX_PATH.format(list=MAILING_LIST, year=year, month=month)
         mbox_path = path.join(cache_dir, mbox_name)
-        mbox_paths[mbox_path] = (year, month)
 
         if path.exists(mbox_path):
             mbox_modified = datetime.fromtimestamp(path.getmtime(mbox_path)).date()
@@ -87,34 +105,87 @@ def mboxes_download(cache_dir, month_start, refresh=True):
                 os.remove(mbox_path)
             else:
                 logger.debug('available from cache')
-                continue
+                mbox_url = None
+
+        plan.append((mbox_path, (year, month), mbox_url))
 
-        # Download, decompress, and write to cache.
+    return list(reversed(plan))
+
+def mbox_download(item):
+    """Download, decompress, and write to cache unless already available."""
+    mbox_path, month, mbox_url = item
+    if mbox_url:
         response = requests.get(mbox_url)
         with gzip.GzipFile(fileobj=io.BytesIO(response.content)) as mbox_gzip:
             with open(mbox_path, 'wb') as mbox_file:
                 shutil.copyfileobj(mbox_gzip, mbox_file)
 
-    return mbox_paths
+    return mbox_path, month
 
-def mboxes_process(mbox_paths):
-    """Process a set of mboxes instead message tree and detect releases."""
-    root = Node('root')
-    lookup = {}
-    releases = {}
+def mboxes_download(cache_dir, month_start, refresh=True):
+    """Download mboxes for given month range.
+
+    Mboxes are yielded oldest first as they become available while a pool of
+    workers continues downloading those that follow.
+    """
+    plan = mboxes_plan(cache_dir, month_start, refresh)
+    return prefetch_ordered(mbox_download, plan, MAILBOX_WORKERS, MAILBOX_PREFETCH)
+
+def release_pattern_compile(month):
+    if int(month[0]) > MIGRATION_YEAR or (int(month[0]) == MIGRATION_YEAR and int(month[1]) >= MIGRATION_MONTH + 1):
+        # To test ones sanity the mailing list prefix was dropped after the
+        # migration so this will miss 20201129 released on Nov 30.
+        return re.compile(RELEASE_PATTERN_POST)
+
+    return re.compile(RELEASE_PATTERN_PRE.format(list=MAILING_LIST))
+
+def mbox_mentions(mbox_path, key_start=0):
+    """Find releases mentioned in message bodies keyed by mbox key.
+
+    Messages are delimited the same as mailbox.mbox such that keys match.
+    """
+    mentions = {}
+    if not path.getsize(mbox_path):
+        return mentions
+
+    with open(mbox_path, 'rb') as mbox_file, mmap.mmap(mbox_file.fileno(), 0, access=mmap.ACCESS_READ) as mbox_map:
+        key = -1
+        skip = True
+        for match in MENTION_PATTERN.finditer(mbox_map):
+            if match.group('headers') is not None:
+                key += 1
+                skip = key < key_start or MENTION_SKIP_PATTERN.search(match.group('headers'))
+            elif match.group('release') and not skip:
+                mentions.setdefault(key, set()).add(match.group('release').decode('ascii'))
+
+    return mentions
+
+def mboxes_process(mbox_paths, tree=None, counts=None, scan_bodies=False):
+    """Process a set of mboxes instead message tree and detect releases.
+
+    Mboxes are expected as (path, month) pairs oldest first. A tree from a
+    previous call may be provided to extend along with counts of messages
+    previously processed per mbox which will be skipped and updated.
+
+    Optionally, releases mentioned in message bodies are recorded as mentions.
+    """
+    root, lookup, releases = tree or (Node('root'), {}, {})
+    if counts is None:
+        counts = {}
 
     # Process in reverse order to allow newer messages to reference older ones.
-    release_pattern = re.compile(RELEASE_PATTERN_PRE.format(list=MAILING_LIST))
-    for mbox_path, month in sorted(mbox_paths.items()):
-        if int(month[0]) > MIGRATION_YEAR or (int(month[0]) == MIGRATION_YEAR and int(month[1]) >= MIGRATION_MONTH + 1):
-            # To test ones sanity the mailing list prefix was dropped after the
-            # migration so this will miss 20201129 released on Nov 30.
-            release_pattern = re.compile(RELEASE_PATTERN_POST)
-
+    for mbox_path, month in mbox_paths:
+        release_pattern = release_pattern_compile(month)
         index = '-'.join(month)
         mbox = mailbox.mbox(mbox_path)
 
+        count = counts.get(mbox_path, 0)
+        counts[mbox_path] = len(mbox)
+        mentions = mbox_mentions(mbox_path, count) if scan_bodies else {}
         for key in mbox.iterkeys():
+            if key < count:
+                continue
+
             message = mbox[key]
             logger.debug('<%s> %s', key, message['subject'])
 
@@ -156,7 +227,8 @@ def mboxes_process(mbox_paths):
                 release = False
 
             lookup[message['message-id']] = Node(
-                '{}.{}'.format(index, key), parent=parent, message=message, month=month, release=release)
+                '{}.{}'.format(index, key), parent=parent, message=message, month=month, release=release,
+                mentions=mentions.get(key, set()))
 
     return root, lookup, releases
 
@@ -195,8 +267,29 @@ def discussions_find(root, lookup, releases):
 
     return discussions
 
-def discussions_reduce(discussions):
-    """Merge discussions whose subject reduces to the same summary"""
+def discussions_candidates(root, releases, discussions):
+    """Find threads not otherwise related to a release mentioning one in the body.
+
+    The latest release mentioned is chosen as with subjects.
+    """
+    related = set(message_node for message_nodes in discussions.values() for message_node in message_nodes)
+    candidates = {}
+    for message_node in root.children:
+        if message_node.release or message_node in related:
+            continue
+
+        mentioned = [release for release in message_node.mentions if release in releases]
+        if mentioned:
+            candidates.setdefault(max(mentioned), []).append(message_node)
+
+    return candidates
+
+def discussions_reduce(discussions, fuzzy_threshold=None):
+    """Merge discussions whose subject reduces to the same summary.
+
+    Optionally, also merge discussions with summaries at least as similar as
+    the threshold into the first such discussion.
+    """
     for release, message_nodes in discussions.items():
         message_nodes_merged = {}
         for message_node in message_nodes:
@@ -206,10 +299,71 @@ def discussions_reduce(discussions):
             else:
                 message_nodes_merged[summary].append(message_node)
 
+        if fuzzy_threshold is not None:
+            summaries = list(message_nodes_merged)
+            message_nodes_merged = {
+                summaries[group[0]]: [node for index in group for node in message_nodes_merged[summaries[index]]]
+                for group in summaries_cluster(summaries, fuzzy_threshold)}
+
         discussions[release] = message_nodes_merged
 
     return discussions
 
+def summary_shingles(summary):
+    """Reduce summary to trigrams of normalized words ignoring word order."""
+    if summary in SUMMARY_PLACEHOLDERS:
+        return set()
+
+    shingles = set()
+    for word in re.findall(r'[a-z0-9]+', summary.lower()):
+        if word in SUMMARY_STOPWORDS:
+            continue
+
+        if len(word) > 4:
+            word = re.sub(r'(?:es|s|ing|ed)$', '', word)
+        word = ' {} '.format(word)
+        shingles.update(word[i:i + 3] for i in range(len(word) - 2))
+
+    return shingles
+
+def summaries_cluster(summaries, threshold):
+    """Group indices of summaries with a trigram Jaccard similarity of at least threshold.
+
+    Candidates are found through an inverted trigram index rather than by
+    comparing all pairs and are joined transitively. Groups are ordered by
+    and contain indices in ascending order.
+    """
+    parents = list(range(len(summaries)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    index_lookup = {}
+    sizes = []
+    for index, summary in enumerate(summaries):
+        shingles = summary_shingles(summary)
+        sizes.append(len(shingles))
+
+        overlaps = {}
+        for shingle in shingles:
+            for other in index_lookup.get(shingle, []):
+                overlaps[other] = overlaps.get(other, 0) + 1
+            index_lookup.setdefault(shingle, []).append(index)
+
+        for other, overlap in overlaps.items():
+            if overlap / (sizes[index] + sizes[other] - overlap) >= threshold:
+                root, root_other = find(index), find(other)
+                parents[max(root, root_other)] = min(root, root_other)
+
+    groups = {}
+    for index in range(len(summaries)):
+        groups.setdefault(find(index), []).append(index)
+
+    return list(groups.values())
+
 def subject_reduce(message, release):
     """Reduce subject to essential summary without mail clutter."""
     subject = message['subject']
@@ -238,20 +392,24 @@ def subject_reduce(message, release):
 
     return subject
 
-def discussions_export(lookup, releases, discussions):
-    export = {}
+def discussions_export(lookup, releases, discussions, candidates=None):
+    """Export discussions along with candidates when provided.
+
+    Yields (release, details) pairs in release order as each is assembled.
+    """
     for release, message_id in sorted(releases.items()):
-        export[release] = {
+        details = {
             'announcement': '::'.join([lookup[message_id].name, message_id]),
             'reference_count': 0,
             'thread_count': 0,
             'threads': [],
         }
 
-        if release not in discussions:
-            continue
+        if candidates is not None:
+            details['candidates'] = [
+                '::'.join([message.name, message.message['message-id']]) for message in candidates.get(release, [])]
 
-        for summary, messages in discussions[release].items():
+        for summary, messages in discussions.get(release, {}).items():
             thread = {
                 'reference_count': 0,
                 'summary': summary,
@@ -263,21 +421,24 @@ def discussions_export(lookup, releases, discussions):
 
                 thread_size = len(message.descendants) + 1 # Include self.
                 thread['reference_count'] += thread_size
-                export[release]['reference_count'] += thread_size
+                details['reference_count'] += thread_size
 
-            export[release]['threads'].append(thread)
-            export[release]['thread_count'] += 1
+            details['threads'].append(thread)
+            details['thread_count'] += 1
 
-    return export
+        yield release, details
 
 def discussion_print(export):
-    for release, details in export.items():
+    """Print (release, details) pairs while passing them along."""
+    for release, details in export:
         print('{} <{} / {}>'.format(release, details['reference_count'], details['thread_count']))
 
         for thread in details['threads']:
             print('- {} <{} / {}>'.format(
                 thread['summary'], thread['reference_count'], ', '.join(thread['messages'])))
 
+        yield release, details
+
 def mailing_list_url(message):
     name, message_id = message.split('::', 1)
     month, number = name.split('.')
@@ -294,32 +455,32 @@ def message_id_hash(message_id):
     message_id = email.utils.unquote(message_id).encode('utf-8')
     return b32encode(sha1(message_id).digest()).decode('utf-8')
 
-def main(logger_, cache_dir, start_month, output_dir, refresh=True):
+def main(logger_, cache_dir, start_month, output_dir, refresh=True, scan_bodies=False, fuzzy_threshold=None):
     global logger
     logger = logger_
 
     ensure_directory(cache_dir)
 
     mbox_paths = mboxes_download(cache_dir, start_month, refresh)
-    root, lookup, releases = mboxes_process(mbox_paths)
+    root, lookup, releases = mboxes_process(mbox_paths, scan_bodies=scan_bodies)
     discussions = discussions_find(root, lookup, releases)
-    discussions = discussions_reduce(discussions)
-    export = discussions_export(lookup, releases, discussions)
-
-    ensure_directory(output_dir)
-    with open(path.join(output_dir, 'mail.yaml'), 'w') as outfile:
-        yaml.safe_dump(export, outfile)
+    candidates = discussions_candidates(root, releases, discussions) if scan_bodies else None
+    discussions = discussions_reduce(discussions, fuzzy_threshold)
 
     if logger.isEnabledFor(logging.DEBUG):
         from anytree import RenderTree, AsciiStyle
         print(RenderTree(root, style=AsciiStyle()).by_attr())
 
-    discussion_print(export)
+    ensure_directory(output_dir)
+    export = discussions_export(lookup, releases, discussions, candidates)
+    if not yaml_write(output_dir, 'mail.yaml', discussion_print(export)):
+        logger.debug('mail unchanged')
 
 def argparse_main(args):
     cache_dir = path.join(args.cache_dir, 'mbox')
     output_dir = path.join(args.output_dir, 'data')
-    main(args.logger, cache_dir, args.start_month, output_dir, not args.no_refresh)
+    main(args.logger, cache_dir, args.start_month, output_dir, not args.no_refresh, args.scan_bodies,
+         args.fuzzy_threshold)
 
 def date_month_arg(string):
     try:
@@ -327,15 +488,38 @@ def date_month_arg(string):
     except ValueError:
         raise argparse.ArgumentTypeError('invalid date "{}"'.format(string))
 
-def argparse_configure(subparsers):
-    parser = subparsers.add_parser(
-        'mail',
-        help='Ingest {} mailing list data and dump as JSON and YAML.'.format(MAILING_LIST))
-    parser.set_defaults(func=argparse_main)
-    parser.add_argument('--no-refresh',
+def similarity_arg(string):
+    try:
+        value = float(string)
+    except ValueError:
+        value = None
+
+    if value is None or not 0 < value <= 1:
+        raise argparse.ArgumentTypeError('invalid similarity "{}" not within (0, 1]'.format(string))
+
+    return value
+
+def argparse_arguments(parser, refresh_optional=True):
+    """Add mail ingest arguments to parser, shared by subcommands running it."""
+    parser.add_argument('--fuzzy-threshold',
+                        type=similarity_arg,
+                        metavar='SIMILARITY',
+                        help='also merge threads with summaries of at least this similarity (0 to 1)')
+    if refresh_optional:
+        parser.add_argument('--no-refresh',
+                            action='store_true',
+                            help='do not refresh relevant mboxes')
+    parser.add_argument('--scan-bodies',
                         action='store_true',
-                        help='do not refresh relevant mboxes')
+                        help='find threads mentioning releases only in message bodies')
     parser.add_argument('-s', '--start-month',
                         type=date_month_arg,
                         default='2016-01',
                         help='Start month from which to ingest mboxes')
+
+def argparse_configure(subparsers):
+    parser = subparsers.add_parser(
+        'mail',
+        help='Ingest {} mailing list data and dump as JSON and YAML.'.format(MAILING_LIST))
+    parser.set_defaults(func=argparse_main)
+    argparse_arguments(parser)
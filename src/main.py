@@ -5,22 +5,36 @@ import logging
 from os import path
 import sys
 from util.common import CACHE_ROOT_DIR
+from util.common import files_changed_report
 from util.common import jekyll_init
 from util.git import sync
+import util.git
 from xdg.BaseDirectory import save_cache_path
 
 import bug
+import index
 import mail
 import markdown
+import pipeline
 import score
 import snapshot
+import watch
 
+REPO_URL = 'git@github.com:boombatower/tumbleweed-review-site'
+REPO_URL_READ_ONLY = 'https://github.com/boombatower/tumbleweed-review-site'
 SCRIPT_PATH = path.dirname(path.realpath(__file__))
 ROOT_PATH = path.normpath(path.join(SCRIPT_PATH, '..'))
 
 def main(args):
     print('TODO')
 
+def upstreams_configure(args):
+    """Point modules at alternate upstreams, such as local mirrors or fixtures."""
+    bug.BUGZILLA_BASEURL = args.bugzilla_baseurl
+    mail.MAILBOX_BASEURL = args.mailbox_baseurl
+    snapshot.SNAPSHOT_BASEURL = args.snapshot_baseurl
+    util.git.GIT_SYNC_URL = args.git_sync_url
+
 def directory_type(string):
     if path.isdir(string):
         return string
@@ -33,6 +47,10 @@ if __name__ == '__main__':
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.set_defaults(func=main)
 
+    parser.add_argument('--bugzilla-baseurl',
+                        default=bug.BUGZILLA_BASEURL,
+                        metavar='URL',
+                        help='bugzilla base URL used for links')
     parser.add_argument('--cache-dir',
                         type=directory_type,
                         default=save_cache_path(CACHE_ROOT_DIR),
@@ -40,19 +58,37 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--debug',
                         action='store_true',
                         help='print debugging information')
+    parser.add_argument('--git-sync-url',
+                        default=util.git.GIT_SYNC_URL,
+                        metavar='URL',
+                        help='git-sync repository URL')
+    parser.add_argument('--mailbox-baseurl',
+                        default=mail.MAILBOX_BASEURL,
+                        metavar='URL',
+                        help='mailing list archive base URL')
     parser.add_argument('-o', '--output-dir',
                         type=directory_type,
                         help='output directory')
     parser.add_argument('--read-only',
                         action='store_true',
                         help='opperate on site in read-only mode')
+    parser.add_argument('--repo-url',
+                        metavar='URL',
+                        help='site repository URL overriding the --read-only choice')
+    parser.add_argument('--snapshot-baseurl',
+                        default=snapshot.SNAPSHOT_BASEURL,
+                        metavar='URL',
+                        help='snapshot history base URL')
 
     subparsers = parser.add_subparsers(title='subcommands')
     bug.argparse_configure(subparsers)
+    index.argparse_configure(subparsers)
     mail.argparse_configure(subparsers)
     markdown.argparse_configure(subparsers)
+    pipeline.argparse_configure(subparsers)
     score.argparse_configure(subparsers)
     snapshot.argparse_configure(subparsers)
+    watch.argparse_configure(subparsers)
 
     args = parser.parse_args()
 
@@ -61,17 +97,24 @@ if __name__ == '__main__':
     logger = logging.getLogger()
     args.logger = logger
 
+    upstreams_configure(args)
+
     repo_url = None
     if not args.output_dir:
-        if args.read_only:
-            repo_url = 'https://github.com/boombatower/tumbleweed-review-site'
+        if args.repo_url:
+            repo_url = args.repo_url
+        elif args.read_only:
+            repo_url = REPO_URL_READ_ONLY
         else:
-            repo_url = 'git@github.com:boombatower/tumbleweed-review-site'
+            repo_url = REPO_URL
         args.output_dir = sync(args.cache_dir, repo_url)
 
+    args.repo_url = repo_url
+
     jekyll_init(args.output_dir)
 
     ret = args.func(args)
+    files_changed_report(logger)
     if repo_url and path.exists(path.join(args.output_dir, '.git')) and not ret:
         sync(args.cache_dir, repo_url)
     sys.exit(ret)
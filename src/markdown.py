@@ -1,11 +1,19 @@
 from bug import bugzilla_url
+import json
 from mail import mailing_list_url
 from main import ROOT_PATH
+from multiprocessing import Pool
 from os import path
 from snapshot import snapshot_url
 from util.common import ensure_directory
+from util.common import file_write
 from util.common import release_parts
 from util.common import yaml_load
+from util.common import yaml_write
+
+TEMPLATE_PATH = path.join(ROOT_PATH, 'jekyll', '_posts', '.template.md')
+POST_CHUNK = 32
+RELEASES_LATEST = 20
 
 def data_load(data_dir):
     return yaml_load(data_dir, 'bug.yaml'), \
@@ -30,12 +38,12 @@ def mail_build(mail_release):
 
     for thread in sorted(mail_release['threads'],
                          key=lambda t: t['reference_count'], reverse=True):
-        line = link_format(thread['summary'], mailing_list_url(thread['messages'][0]))
+        line = link_format(thread['summary'], message_url(thread['messages'][0]))
         line += ' ({} refs)'.format(thread['reference_count'])
         extra = []
         for message in thread['messages'][1:]:
             name, _ = message.split('::', 1)
-            extra.append(link_format(name, mailing_list_url(message)))
+            extra.append(link_format(name, message_url(message)))
 
         if len(extra):
             line += '; ' + ', '.join(extra)
@@ -63,83 +71,198 @@ def table_format(headings, data, bold):
 def link_format(text, href):
     return '[{}]({})'.format(text.replace('[', '\[').replace(']', '\]'), href)
 
-def posts_build(posts_dir, bug, mail, score, snapshot):
-    template_path = path.join(ROOT_PATH, 'jekyll', '_posts', '.template.md')
+def post_init(template_path, links):
+    """Prepare template and link cache once per process."""
+    global template, link_cache, link_cache_new
     with open(template_path, 'r') as template_handle:
         template = template_handle.read()
 
+    link_cache = links
+    link_cache_new = {}
+
+def message_url(message):
+    """Memoized mailing_list_url() whose results are persisted across runs."""
+    url = link_cache.get(message)
+    if url is None:
+        url = link_cache[message] = link_cache_new[message] = mailing_list_url(message)
+    return url
+
+def post_write(item):
+    posts_dir, release, bug_release, mail_release, score_release, snapshot_release = item
+
+    reference_count_bug, bug_markdown = bug_build(bug_release)
+    reference_count_mail, mail_markdown = mail_build(mail_release)
+    reference_count = reference_count_bug + reference_count_mail
+
+    variables = {
+        'release_available': str(snapshot_release is not None).lower(),
+        'release_reference_count': reference_count,
+        'release_reference_count_mail': reference_count_mail,
+        'release_score': score_release.get('score', 'n/a'),
+        'release_stability_level': score_release.get('stability_level', 'unknown'),
+        'release_version': release,
+    }
+    links = []
+
+    links.append(link_format('mail announcement', message_url(mail_release['announcement'])))
+
+    if snapshot_release is not None:
+        for key, value in snapshot_release.items():
+            if not key.startswith('binary_interest'):
+                variables['release_{}'.format(key)] = value
+
+        binary_interest = table_format(['Binary', 'Version'], snapshot_release['binary_interest'], snapshot_release['binary_interest_changed'])
+
+        links.append(link_format('binary unique list', snapshot_url(release, 'rpm.unique.list')))
+        links.append(link_format('binary list', snapshot_url(release, 'rpm.list')))
+    else:
+        binary_interest = ''
+
+    if not bug_markdown:
+        bug_markdown = 'no relevant bugs'
+    if not mail_markdown:
+        mail_markdown = 'no relevant mails'
+
+    links = '- ' + '\n- '.join(links)
+
+    post = template.format(
+        release=release,
+        variables=variables_format(variables),
+        bug=bug_markdown,
+        bug_count=reference_count_bug,
+        mail=mail_markdown,
+        mail_count=mail_release['thread_count'],
+        mail_reference_count=reference_count_mail,
+        binary_interest=binary_interest,
+        links=links,
+    )
+
+    date = '-'.join(release_parts(release))
+    post_name = '{}-release.md'.format(date)
+    post_path = path.join(posts_dir, post_name)
+    with open(post_path, 'w') as post_handle:
+        post_handle.write(post)
+
+    # Hand back links not previously cached so they may be persisted.
+    links_new = dict(link_cache_new)
+    link_cache_new.clear()
+    return links_new
+
+def posts_build(posts_dir, bug, mail, score, snapshot, links=None, jobs=None):
+    """Write a post per release split across a pool of workers.
+
+    Returns mailing list links generated in addition to those provided.
+    """
+    if links is None:
+        links = {}
+
     # Likely want to ingest release data as seperate item directly from source.
-    for release, mail_release in mail.items():
-        reference_count_bug, bug_markdown = bug_build(bug.get(release, []))
-        reference_count_mail, mail_markdown = mail_build(mail_release)
-        reference_count = reference_count_bug + reference_count_mail
-        score_release = score.get(release, {})
-
-        variables = {
-            'release_available': str(release in snapshot).lower(),
-            'release_reference_count': reference_count,
-            'release_reference_count_mail': reference_count_mail,
-            'release_score': score_release.get('score', 'n/a'),
-            'release_stability_level': score_release.get('stability_level', 'unknown'),
-            'release_version': release,
-        }
-        links = []
-
-        links.append(link_format('mail announcement', mailing_list_url(mail_release['announcement'])))
-
-        if release in snapshot:
-            release_snapshot = snapshot[release]
-            for key, value in release_snapshot.items():
-                if not key.startswith('binary_interest'):
-                    variables['release_{}'.format(key)] = value
-
-            binary_interest = table_format(['Binary', 'Version'], release_snapshot['binary_interest'], release_snapshot['binary_interest_changed'])
-
-            links.append(link_format('binary unique list', snapshot_url(release, 'rpm.unique.list')))
-            links.append(link_format('binary list', snapshot_url(release, 'rpm.list')))
-        else:
-            binary_interest = ''
-
-        if not bug_markdown:
-            bug_markdown = 'no relevant bugs'
-        if not mail_markdown:
-            mail_markdown = 'no relevant mails'
-
-        links = '- ' + '\n- '.join(links)
-
-        post = template.format(
-            release=release,
-            variables=variables_format(variables),
-            bug=bug_markdown,
-            bug_count=reference_count_bug,
-            mail=mail_markdown,
-            mail_count=mail_release['thread_count'],
-            mail_reference_count=reference_count_mail,
-            binary_interest=binary_interest,
-            links=links,
-        )
-
-        date = '-'.join(release_parts(release))
-        post_name = '{}-release.md'.format(date)
-        post_path = path.join(posts_dir, post_name)
-        with open(post_path, 'w') as post_handle:
-            post_handle.write(post)
-
-def main(logger_, posts_dir, data_dir):
+    items = ((posts_dir, release, bug.get(release, []), mail_release,
+              score.get(release, {}), snapshot.get(release))
+             for release, mail_release in mail.items())
+
+    links_new = {}
+    if jobs == 1:
+        post_init(TEMPLATE_PATH, dict(links))
+        for item in items:
+            links_new.update(post_write(item))
+    else:
+        with Pool(jobs, post_init, (TEMPLATE_PATH, links)) as pool:
+            for links_item in pool.imap_unordered(post_write, items, POST_CHUNK):
+                links_new.update(links_item)
+
+    return links_new
+
+def release_entry(release, bug_release, mail_release, score_release, snapshot_release):
+    """Summarize release for listing without requiring the post."""
+    year, month, day = release_parts(release)
+    entry = {
+        'available': snapshot_release is not None,
+        'bug_count': len(bug_release),
+        'date': '-'.join([year, month, day]),
+        'mail_reference_count': mail_release['reference_count'],
+        'mail_thread_count': mail_release['thread_count'],
+        'release': release,
+        'score': score_release.get('score', 'n/a'),
+        'stability_level': score_release.get('stability_level', 'unknown'),
+        'url': '/{}/{}/{}/release.html'.format(year, month, day),
+    }
+
+    if snapshot_release is not None:
+        entry['binary_count'] = snapshot_release['binary_count']
+        entry['binary_unique_count'] = snapshot_release['binary_unique_count']
+        entry['disk_base'] = snapshot_release['disk_base']
+        entry['disk_shared'] = snapshot_release['disk_shared']
+
+    return entry
+
+def releases_build(data_dir, pages_dir, bug, mail, score, snapshot):
+    """Write release listings per year and of latest as Jekyll data and pages.
+
+    Aggregating ahead of time avoids iterating over every post in Liquid.
+    """
+    ensure_directory(path.join(data_dir, 'releases'))
+    ensure_directory(pages_dir)
+
+    years = {}
+    for release, mail_release in sorted(mail.items(), reverse=True):
+        years.setdefault(release[0:4], []).append(release_entry(
+            release, bug.get(release, []), mail_release, score.get(release, {}), snapshot.get(release)))
+
+    for year, entries in years.items():
+        yaml_write(path.join(data_dir, 'releases'), '{}.yml'.format(year), entries)
+        file_write(path.join(pages_dir, '{}.md'.format(year)),
+                   '---\nlayout: releases\ntitle: Releases {0}\nyear: "{0}"\n---\n'.format(year).encode('utf-8'))
+
+    latest = {
+        'releases': [entry for entries in years.values() for entry in entries][:RELEASES_LATEST],
+        'years': [{'count': len(entries), 'url': '/releases/{}.html'.format(year), 'year': year}
+                  for year, entries in years.items()],
+    }
+    yaml_write(data_dir, 'releases_latest.yml', latest)
+
+def links_load(cache_dir):
+    links_path = path.join(cache_dir, 'link.json')
+    if path.exists(links_path):
+        with open(links_path, 'r') as handle:
+            return json.load(handle)
+
+    return {}
+
+def links_save(cache_dir, links):
+    file_write(path.join(cache_dir, 'link.json'), json.dumps(links, sort_keys=True).encode('utf-8'))
+
+def main(logger_, cache_dir, site_dir, data_dir, jobs=None):
     global logger
     logger = logger_
 
+    posts_dir = path.join(site_dir, '_posts')
+    ensure_directory(cache_dir)
     ensure_directory(posts_dir)
     bug, mail, score, snapshot = data_load(data_dir)
-    posts_build(posts_dir, bug, mail, score, snapshot)
+    links = links_load(cache_dir)
+    links_new = posts_build(posts_dir, bug, mail, score, snapshot, links, jobs)
+    releases_build(path.join(site_dir, '_data'), path.join(site_dir, 'releases'), bug, mail, score, snapshot)
+
+    if links_new:
+        logger.debug('caching %d new links', len(links_new))
+        links.update(links_new)
+        links_save(cache_dir, links)
 
 def argparse_main(args):
-    posts_dir = path.join(args.output_dir, '_posts')
+    cache_dir = path.join(args.cache_dir, 'markdown')
     data_dir = path.join(args.output_dir, 'data')
-    main(args.logger, posts_dir, data_dir)
+    main(args.logger, cache_dir, args.output_dir, data_dir, args.jobs)
+
+def argparse_arguments(parser):
+    """Add markdown arguments to parser, shared by subcommands running it."""
+    parser.add_argument('-j', '--jobs',
+                        type=int,
+                        help='number of worker processes (default CPU count)')
 
 def argparse_configure(subparsers):
     parser = subparsers.add_parser(
         'markdown',
         help='Generate markdown files for Jekyll site.')
     parser.set_defaults(func=argparse_main)
+    argparse_arguments(parser)
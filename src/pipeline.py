@@ -0,0 +1,31 @@
+import bug
+import mail
+import markdown
+import score
+import snapshot
+
+def argparse_main(args):
+    """Run each stage in dependency order as the individual subcommands would."""
+    # Bugs are associated with releases found in mail and scoring requires all data.
+    args.logger.info('stage: mail')
+    mail.argparse_main(args)
+    args.logger.info('stage: snapshot')
+    snapshot.argparse_main(args)
+
+    args.start_month = args.bug_start_month
+    args.logger.info('stage: bug')
+    bug.argparse_main(args)
+
+    args.logger.info('stage: score')
+    score.argparse_main(args)
+    args.logger.info('stage: markdown')
+    markdown.argparse_main(args)
+
+def argparse_configure(subparsers):
+    parser = subparsers.add_parser(
+        'all',
+        help='Ingest all data, score, and generate markdown.')
+    parser.set_defaults(func=argparse_main)
+    bug.argparse_arguments(parser, ('--bug-start-month',))
+    mail.argparse_arguments(parser)
+    markdown.argparse_arguments(parser)
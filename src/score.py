@@ -1,10 +1,39 @@
 from datetime import date
+from index import index_publish
+from itertools import product
+import numpy as np
 from os import path
 from util.common import ensure_directory
 from util.common import release_to_date
 from util.common import yaml_load
+from util.common import yaml_write
 import yaml
 
+LEVELS = ['stable', 'moderate', 'unstable']
+LEVEL_STABLE = 90
+LEVEL_MODERATE = 70
+
+# Default weights used to score releases, see score_compute() for details.
+WEIGHTS = {
+    'decay': 0.40,
+    'bug_divisor': 10,
+    'reference_min': 3,
+    'reference_max': 25,
+    'kernel_minor_1': 15,
+    'kernel_minor_3': 10,
+    'mesa_minor_0': 5,
+    'churn_threshold': 0.35,
+    'churn': 10,
+}
+CHAIN_TOLERANCE = 1e-9
+SWEEP_CHUNK = 512
+SWEEP_GRID = {
+    'decay': '0.2:0.6:9',
+    'reference_max': '15:35:5',
+    'kernel_minor_1': '5:25:5',
+    'churn_threshold': '0.25:0.45:5',
+}
+
 def stability_level(release, score):
     release_date = release_to_date(release)
     if (date.today() - release_date).days < 7:
@@ -14,93 +43,362 @@ def stability_level(release, score):
         return 'unknown'
 
     score = int(score)
-    if score > 90:
+    if score > LEVEL_STABLE:
         return 'stable'
-    if score > 70:
+    if score > LEVEL_MODERATE:
         return 'moderate';
     return 'unstable'
 
-def bug_score(bugs):
-    return len(bugs) / 10
+def version_minor(version):
+    """Extract minor from a major.minor.patch version or -1 if not applicable."""
+    parts = version.split('.')
+    if len(parts) == 3 and parts[2].isdigit():
+        return int(parts[2])
+    return -1
 
-def mail_score(mail_release):
-    impact = 0
-    for thread in mail_release['threads']:
-        impact += max(min(thread['reference_count'], 25), 3)
-    return impact
+def factors_build(bugs, mail, snapshot):
+    """Gather per-release factor inputs into arrays ordered by release."""
+    releases = list(mail)
+    release_count = len(releases)
+
+    factors = {
+        'releases': releases,
+        'bug_count': np.zeros(release_count),
+        'thread_offsets': np.zeros(release_count + 1, dtype=np.int64),
+        'kernel_minor': np.full(release_count, -1, dtype=np.int64),
+        'mesa_minor': np.full(release_count, -1, dtype=np.int64),
+        'churn': np.full(release_count, np.nan),
+    }
+
+    thread_references = []
+    for index, (release, mail_release) in enumerate(mail.items()):
+        factors['bug_count'][index] = len(bugs.get(release, []))
+
+        for thread in mail_release['threads']:
+            thread_references.append(thread['reference_count'])
+        factors['thread_offsets'][index + 1] = len(thread_references)
 
-def snapshot_score(snapshot):
-    if not snapshot:
         # Any snapshot deltas will be noticed in next snapshot anyway.
-        return 0
+        snapshot_release = snapshot.get(release)
+        if not snapshot_release:
+            continue
 
-    impact = 0
+        binary_interest = snapshot_release['binary_interest']
+        if 'kernel-source' in binary_interest:
+            factors['kernel_minor'][index] = version_minor(binary_interest['kernel-source'])
+        if 'Mesa' in snapshot_release['binary_interest_changed']:
+            factors['mesa_minor'][index] = version_minor(binary_interest['Mesa'])
+        factors['churn'][index] = snapshot_release['binary_unique_count'] / snapshot_release['binary_count']
 
-    binary_interest = snapshot['binary_interest']
-    binary_interest_changed = snapshot['binary_interest_changed']
+    factors['thread_references'] = np.array(thread_references, dtype=np.float64)
 
-    parts = binary_interest['kernel-source'].split('.')
-    if len(parts) == 3:
-        minor = int(parts[2])
-        if minor <= 1:
-            impact += 15
-        elif minor <= 3:
-            impact += 10
+    return factors
 
-    if 'Mesa' in binary_interest_changed:
-        parts = binary_interest['Mesa'].split('.')
-        if len(parts) == 3:
-            minor = int(parts[2])
-            if minor == 0:
-                impact += 5
+def weights_array(weights):
+    """Convert weights of scalars or equal length sequences to column arrays."""
+    weights = dict(WEIGHTS, **weights)
+    return {key: np.atleast_1d(np.asarray(value, dtype=np.float64))[:, None] for key, value in weights.items()}
 
-    if snapshot['binary_unique_count'] / snapshot['binary_count'] > 0.35:
-        impact += 10
+def mail_impact(factors, weights):
+    # Thread references are integral so the sums are exact regardless of order.
+    offsets = factors['thread_offsets']
+    references = np.maximum(np.minimum(factors['thread_references'], weights['reference_max']),
+                            weights['reference_min'])
+    references_sum = np.zeros((references.shape[0], len(factors['thread_references']) + 1))
+    np.cumsum(references, axis=1, out=references_sum[:, 1:])
+    return references_sum[:, offsets[1:]] - references_sum[:, offsets[:-1]]
 
+def snapshot_impact(factors, weights):
+    kernel_minor = factors['kernel_minor']
+    impact = np.where((kernel_minor >= 0) & (kernel_minor <= 1), weights['kernel_minor_1'],
+                      np.where((kernel_minor > 1) & (kernel_minor <= 3), weights['kernel_minor_3'], 0.0))
+    impact = impact + np.where(factors['mesa_minor'] == 0, weights['mesa_minor_0'], 0.0)
+    with np.errstate(invalid='ignore'):
+        impact = impact + np.where(factors['churn'] > weights['churn_threshold'], weights['churn'], 0.0)
     return impact
 
-def score(bugs, mail, snapshot):
-    scores = {}
+def impact_base_compute(factors, weights):
+    """Compute release impacts prior to carry-over from previous releases."""
+    impact_base = (factors['bug_count'] / weights['bug_divisor'] + mail_impact(factors, weights)) + \
+        snapshot_impact(factors, weights)
+    return np.broadcast_to(impact_base, np.broadcast_shapes(
+        impact_base.shape, weights['decay'].shape)).copy()
 
-    impact_previous = None
-    for release, mail_release in mail.items():
-        impact = 0
-        impact += bug_score(bugs.get(release, []))
-        impact += mail_score(mail_release)
-        impact += snapshot_score(snapshot.get(release, None))
+def score_compute(factors, weights=None):
+    """Compute release impacts and scores for one or more sets of weights.
 
-        if impact_previous:
-            impact += 0.40 * impact_previous
-        impact_previous = impact
+    Each weight may be a sequence to evaluate several sets of weights at once
+    in which case the results contain a row per set. The carry-over of impact
+    from one release to the next is applied across all sets together while
+    keeping the floating point operations identical to the scalar formula.
+    """
+    if weights is None:
+        weights = {}
+    weights = weights_array(weights)
+    impact = impact_base_compute(factors, weights)
+
+    decay = weights['decay'][:, 0]
+    for index in range(1, impact.shape[1]):
+        impact[:, index] += decay * impact[:, index - 1]
+
+    return impact, np.trunc(100 - impact).astype(np.int64)
+
+def releases_pending(releases):
+    today = date.today()
+    return np.array([(today - release_to_date(release)).days < 7 for release in releases], dtype=bool)
+
+def levels_compute(scores):
+    """Compute stability level as an index into LEVELS."""
+    return np.where(scores > LEVEL_STABLE, 0, np.where(scores > LEVEL_MODERATE, 1, 2))
+
+def score(bugs, mail, snapshot):
+    factors = factors_build(bugs, mail, snapshot)
+    _, scores = score_compute(factors)
 
-        score = int(100 - impact)
-        scores[release] = {
+    result = {}
+    for release, score in zip(factors['releases'], scores[0].tolist()):
+        result[release] = {
             'score': score,
             'stability_level': stability_level(release, score),
         }
 
-    return scores
+    return result
+
+def release_inputs(bugs, mail, snapshot, release):
+    """Collect the inputs read by factors_build() for a release as plain values."""
+    inputs = [len(bugs.get(release, [])), [thread['reference_count'] for thread in mail[release]['threads']]]
+    snapshot_release = snapshot.get(release)
+    if snapshot_release:
+        binary_interest = snapshot_release['binary_interest']
+        mesa_changed = 'Mesa' in snapshot_release['binary_interest_changed']
+        inputs += [binary_interest.get('kernel-source'), binary_interest.get('Mesa') if mesa_changed else None,
+                   snapshot_release['binary_unique_count'], snapshot_release['binary_count']]
+    return inputs
+
+def link_current(link, inputs_release, release_previous):
+    """Determine if a chain link was computed from the same inputs and predecessor."""
+    return link is not None and link.get('inputs') == inputs_release and link['previous'] == release_previous
+
+def score_refresh(release, score_release):
+    """Reuse a previous score, re-evaluating pending as it resolves with time alone."""
+    if score_release['stability_level'] != 'pending':
+        return score_release
+
+    return {
+        'score': score_release['score'],
+        'stability_level': stability_level(release, score_release['score']),
+    }
+
+def score_incremental(bugs, mail, snapshot, chain, scores):
+    """Update scores from the earliest release whose inputs changed.
+
+    The chain holds the inputs and impact of each release from the previous
+    run. Releases before the first difference keep their impact and score
+    while factors and impacts are only computed for the remainder. Within the
+    remainder recomputation stops once the carried impact converges with the
+    chain again until the next release whose inputs changed.
+    """
+    if chain.get('weights') != WEIGHTS:
+        chain = {'weights': WEIGHTS, 'releases': {}}
+    chain_releases = chain['releases']
+
+    releases = list(mail)
+    inputs = [release_inputs(bugs, mail, snapshot, release) for release in releases]
+    start = 0
+    release_previous = None
+    for release, inputs_release in zip(releases, inputs):
+        if not link_current(chain_releases.get(release), inputs_release, release_previous) or \
+                release not in scores:
+            break
+        start += 1
+        release_previous = release
+
+    scores_updated = {}
+    chain_updated = {}
+    for release in releases[:start]:
+        scores_updated[release] = score_refresh(release, scores[release])
+        chain_updated[release] = chain_releases[release]
+
+    releases_changed = releases[start:]
+    factors = factors_build(bugs, {release: mail[release] for release in releases_changed}, snapshot)
+    impact_base = impact_base_compute(factors, weights_array({}))[0].tolist()
+    decay = WEIGHTS['decay']
+
+    impact_previous = chain_releases[release_previous]['impact'] if release_previous else None
+    dirty = False
+    recomputed = 0
+    for release, inputs_release, impact in zip(releases_changed, inputs[start:], impact_base):
+        link = chain_releases.get(release)
+        current = link_current(link, inputs_release, release_previous) and release in scores
+
+        if current and not dirty:
+            impact = link['impact']
+            chain_updated[release] = link
+            scores_updated[release] = score_refresh(release, scores[release])
+        else:
+            if impact_previous is not None:
+                impact += decay * impact_previous
+            recomputed += 1
+
+            # Stop once the carried impact matches that of the previous run.
+            dirty = not current or abs(impact - link['impact']) > CHAIN_TOLERANCE
+            chain_updated[release] = {'impact': impact, 'inputs': inputs_release, 'previous': release_previous}
+
+            score = int(100 - impact)
+            scores_updated[release] = {
+                'score': score,
+                'stability_level': stability_level(release, score),
+            }
 
-def main(logger_, data_dir):
+        impact_previous = impact
+        release_previous = release
+
+    logger.debug('recomputed %d of %d releases', recomputed, len(releases))
+
+    return {'weights': WEIGHTS, 'releases': chain_updated}, scores_updated
+
+def sweep_grid(grid):
+    """Expand NAME=START:STOP:COUNT specifications into weight combinations."""
+    axes = {}
+    for name, spec in grid.items():
+        if name not in WEIGHTS:
+            raise ValueError('unknown weight {}'.format(name))
+        start, stop, count = spec.split(':')
+        axes[name] = np.linspace(float(start), float(stop), int(count))
+
+    names = sorted(axes)
+    combinations = np.array(list(product(*(axes[name] for name in names))), dtype=np.float64)
+    return {name: combinations[:, index] for index, name in enumerate(names)}
+
+def sweep_rank(scores, bad_mask):
+    """Probability a known-bad release scores lower than any other release."""
+    other_count = (~bad_mask).sum()
+    if not bad_mask.any() or not other_count:
+        return np.full(scores.shape[0], np.nan)
+
+    scores_other = scores[:, ~bad_mask]
+    ranked = np.zeros(scores.shape[0])
+    for scores_bad in scores[:, bad_mask].T:
+        ranked += (scores_other > scores_bad[:, None]).sum(axis=1)
+        ranked += 0.5 * (scores_other == scores_bad[:, None]).sum(axis=1)
+    return ranked / (bad_mask.sum() * other_count)
+
+def sweep(factors, grid, known_bad=()):
+    """Evaluate weight combinations returning level distribution and rank."""
+    weights = sweep_grid(grid)
+    count = len(next(iter(weights.values())))
+
+    # Pending releases have yet to receive a stability level.
+    final = ~releases_pending(factors['releases'])
+    bad_mask = np.isin(np.array(factors['releases'])[final], list(known_bad))
+
+    distribution = np.zeros((count, len(LEVELS)), dtype=np.int64)
+    rank = np.zeros(count)
+    for start in range(0, count, SWEEP_CHUNK):
+        chunk = {name: values[start:start + SWEEP_CHUNK] for name, values in weights.items()}
+        _, scores = score_compute(factors, chunk)
+        scores = scores[:, final]
+
+        levels = levels_compute(scores)
+        for level in range(len(LEVELS)):
+            distribution[start:start + SWEEP_CHUNK, level] = (levels == level).sum(axis=1)
+        rank[start:start + SWEEP_CHUNK] = sweep_rank(scores, bad_mask)
+
+    return weights, distribution, rank
+
+def sweep_print(factors, grid, known_bad, top):
+    _, baseline, baseline_rank = sweep(factors, {name: '{0}:{0}:1'.format(WEIGHTS[name]) for name in grid}, known_bad)
+    weights, distribution, rank = sweep(factors, grid, known_bad)
+
+    print('evaluated {} weight combinations'.format(len(rank)))
+    print('baseline: {}{}'.format(
+        ' '.join('{}={}'.format(level, count) for level, count in zip(LEVELS, baseline[0])),
+        ' rank {:.3f}'.format(baseline_rank[0]) if known_bad else ''))
+
+    shift = distribution - baseline[0]
+    for level, level_shift in zip(LEVELS, shift.T):
+        print('- {} shift min {:+d} max {:+d}'.format(level, level_shift.min(), level_shift.max()))
+
+    if known_bad:
+        order = np.argsort(-rank, kind='stable')[:top]
+    else:
+        # Without known-bad releases to rank against list the largest shifts.
+        order = np.argsort(-np.abs(shift).sum(axis=1), kind='stable')[:top]
+    for index in order:
+        print('{} <{}>{}'.format(
+            ', '.join('{}={:g}'.format(name, values[index]) for name, values in sorted(weights.items())),
+            ' '.join('{}={:+d}'.format(level, count) for level, count in zip(LEVELS, shift[index])),
+            ' rank {:.3f}'.format(rank[index]) if known_bad else ''))
+
+def data_load(data_dir):
+    return yaml_load(data_dir, 'bug.yaml') or {}, \
+        yaml_load(data_dir, 'mail.yaml'), \
+        yaml_load(data_dir, 'snapshot.yaml') or {}
+
+def main(logger_, cache_dir, data_dir):
     global logger
     logger = logger_
 
+    ensure_directory(cache_dir)
     ensure_directory(data_dir)
 
-    bugs = yaml_load(data_dir, 'bug.yaml')
-    mail = yaml_load(data_dir, 'mail.yaml')
-    snapshot = yaml_load(data_dir, 'snapshot.yaml')
-    scores = score(bugs, mail, snapshot)
+    bugs, mail, snapshot = data_load(data_dir)
+    chain = yaml_load(cache_dir, 'chain.yaml') or {}
+    scores = yaml_load(data_dir, 'score.yaml') or {}
+    chain, scores_updated = score_incremental(bugs, mail, snapshot, chain, scores)
 
-    with open(path.join(data_dir, 'score.yaml'), 'w') as outfile:
-        yaml.safe_dump(scores, outfile, default_flow_style=False)
+    yaml_write(cache_dir, 'chain.yaml', chain)
+    if not yaml_write(data_dir, 'score.yaml', scores_updated):
+        logger.debug('scores unchanged')
+
+    index_publish(path.join(data_dir, 'index'), scores_updated)
+
+def sweep_main(logger_, data_dir, grid, known_bad_path, top):
+    global logger
+    logger = logger_
+
+    known_bad = []
+    if known_bad_path:
+        with open(known_bad_path, 'r') as handle:
+            known_bad = [str(release) for release in yaml.safe_load(handle)]
+
+    factors = factors_build(*data_load(data_dir))
+    sweep_print(factors, grid, known_bad, top)
 
 def argparse_main(args):
+    cache_dir = path.join(args.cache_dir, 'score')
     data_dir = path.join(args.output_dir, 'data')
-    main(args.logger, data_dir)
+    main(args.logger, cache_dir, data_dir)
+
+def argparse_sweep(args):
+    data_dir = path.join(args.output_dir, 'data')
+    grid = dict(SWEEP_GRID)
+    for spec in args.grid:
+        name, _, value = spec.partition('=')
+        grid[name] = value
+    sweep_main(args.logger, data_dir, grid, args.known_bad, args.top)
 
 def argparse_configure(subparsers):
     parser = subparsers.add_parser(
         'score',
         help='Score snapshots based on ingested data.')
     parser.set_defaults(func=argparse_main)
+
+    modes = parser.add_subparsers(title='modes')
+    parser_sweep = modes.add_parser(
+        'sweep',
+        help='Evaluate scoring across a grid of weights.')
+    parser_sweep.set_defaults(func=argparse_sweep)
+    parser_sweep.add_argument('-g', '--grid',
+                              action='append',
+                              default=[],
+                              metavar='NAME=START:STOP:COUNT',
+                              help='weight range to sweep (defaults: {})'.format(
+                                  ', '.join('{}={}'.format(*item) for item in sorted(SWEEP_GRID.items()))))
+    parser_sweep.add_argument('-k', '--known-bad',
+                              metavar='PATH',
+                              help='YAML list of releases known to be bad')
+    parser_sweep.add_argument('-t', '--top',
+                              type=int,
+                              default=10,
+                              help='number of weight combinations to list')
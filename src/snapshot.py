@@ -1,14 +1,21 @@
+from datetime import date
+from datetime import datetime
 from datetime import timedelta
+import numpy as np
 import os
 from os import path
 from packaging.version import parse as version_parse
 import re
+import requests
 import stat
 from urllib.parse import urljoin
 from util.common import ensure_directory
+from util.common import prefetch_ordered
 from util.common import request_cached
+from util.common import release_to_date
 from util.common import request_cached_path
-import yaml
+from util.common import yaml_load
+from util.common import yaml_write
 
 SNAPSHOT_BASEURL = 'http://download.opensuse.org/history/'
 BINARY_REGEX = r'(?:.*::)?(?P<filename>(?P<name>.*?)-(?P<version>[^-]+)-(?P<release>[^-]+)\.(?P<arch>[^-\.]+))\.rpm'
@@ -36,10 +43,82 @@ BINARY_INTEREST = [
     'gtk3-devel',
 ]
 BINARY_INTEREST_GCC = r'^gcc(?P<major_version>\d+)$'
+SNAPSHOT_WORKERS = 4
+SNAPSHOT_PREFETCH = 8
+LIST_TTL = timedelta(hours=1)
+LIST_VALIDATORS_NAME = 'list.yaml'
+PENDING_MAX_AGE = timedelta(days=14)
+PENDING_NAME = 'pending.yaml'
+SHARED_BACKFILL = 100
+TTL_NEVER = timedelta(days=300) # Should never change.
 
 def list_download(cache_dir):
+    """Download list of releases refreshing only the appended tail once stale."""
     url = urljoin(SNAPSHOT_BASEURL, 'list')
-    return request_cached(url, cache_dir).strip().splitlines()
+    list_path = request_cached_path(url, cache_dir)
+    if not path.exists(list_path):
+        ensure_directory(path.dirname(list_path))
+        list_tail_download(url, list_path, cache_dir)
+    elif datetime.now() - datetime.fromtimestamp(path.getmtime(list_path)) > LIST_TTL:
+        list_tail_download(url, list_path, cache_dir)
+
+    with open(list_path, 'r') as handle:
+        return handle.read().strip().splitlines()
+
+def list_tail_download(url, list_path, cache_dir):
+    """Download list or append anything beyond the size of the cached list.
+
+    The list is only ever appended to upstream so a range request from the
+    current size yields the new releases. A server not supporting ranges
+    responds with the full list while a list shorter than the cached one is
+    downloaded again in full. The validators of the server are sent back
+    rather than the local modification time which only tracks the TTL.
+    """
+    if not path.exists(list_path):
+        response = requests.get(url)
+        response.raise_for_status()
+        size = 0
+    else:
+        size = path.getsize(list_path)
+        validators = yaml_load(cache_dir, LIST_VALIDATORS_NAME) or {}
+        headers = {'Range': 'bytes={}-'.format(size)}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+        response = requests.get(url, headers=headers)
+
+    if response.status_code == 416:
+        # Unsatisfiable ranges report the current length as bytes */LENGTH.
+        length = response.headers.get('Content-Range', '').rpartition('/')[2]
+        if length == str(size):
+            logger.debug('list unchanged')
+            os.utime(list_path)
+            return
+
+        logger.debug('list shorter than cached, downloading in full')
+        response = requests.get(url)
+
+    if response.status_code == 304:
+        logger.debug('list unchanged')
+        os.utime(list_path)
+        return
+    elif response.status_code == 206 and response.headers.get('Content-Range', '').startswith('bytes {}-'.format(size)):
+        logger.debug('appending %d bytes to list', len(response.content))
+        with open(list_path, 'ab') as handle:
+            handle.write(response.content)
+    elif response.status_code == 200:
+        logger.debug('replacing list')
+        with open(list_path, 'wb') as handle:
+            handle.write(response.content)
+    else:
+        logger.warning('failed to refresh list (%d), using cached', response.status_code)
+        return
+
+    validators = {key: response.headers[header] for key, header in
+                  [('etag', 'ETag'), ('last_modified', 'Last-Modified')] if header in response.headers}
+    if validators:
+        yaml_write(cache_dir, LIST_VALIDATORS_NAME, validators)
 
 def snapshot_url(release, path):
     return urljoin(SNAPSHOT_BASEURL, '/'.join([release, path]))
@@ -51,41 +130,68 @@ def sizeof_fmt(num, suffix='B'):
         num /= 1024.0
     return "%.1f%s%s" % (num, 'Yi', suffix)
 
-def list_detail_download(cache_dir, releases):
-    details = {}
-
-    binary_regex = re.compile(BINARY_REGEX)
-    binary_gcc_regex = re.compile(BINARY_INTEREST_GCC)
-    ttl_never = timedelta(days=300) # Should never change.
+def release_fetch(cache_dir, release):
+    """Fetch disk and binary lists of release or None if not yet available."""
     ttl_retry = timedelta(hours=4) # While waiting for snapshot.
-    for release in releases:
-        details_release = {}
 
-        url = snapshot_url(release, 'disk')
-        disk_path = request_cached_path(url, cache_dir)
-        if path.exists(disk_path) and not os.stat(disk_path)[stat.ST_SIZE]:
-            logger.debug('using retry ttl for %s disk file', release)
-            disk_ttl = ttl_retry
-        else:
-            disk_ttl = ttl_never
-        disk = request_cached(url, cache_dir, disk_ttl).strip().splitlines()
+    url = snapshot_url(release, 'disk')
+    disk_path = request_cached_path(url, cache_dir)
+    if path.exists(disk_path) and not os.stat(disk_path)[stat.ST_SIZE]:
+        logger.debug('using retry ttl for %s disk file', release)
+        disk_ttl = ttl_retry
+    else:
+        disk_ttl = TTL_NEVER
+    disk = request_cached(url, cache_dir, disk_ttl).strip().splitlines()
+
+    if len(disk) != 2:
+        # Skip for now and retry later.
+        logger.debug('skipping %s due to invalid disk file', release)
+
+        if len(disk) != 0:
+            # Clear cache file to indicate invalid.
+            open(disk_path, 'w').write('')
+
+        return release, None
+
+    binaries = binaries_load(cache_dir, release)
 
-        if len(disk) != 2:
-            # Skip for now and retry later.
-            logger.debug('skipping %s due to invalid disk file', release)
+    url = snapshot_url(release, 'rpm.unique.list')
+    binaries_unique = request_cached(url, cache_dir, TTL_NEVER).strip().splitlines()
 
-            if len(disk) != 0:
-                # Clear cache file to indicate invalid.
-                open(disk_path, 'w').write('')
+    return release, (disk, binaries, binaries_unique)
+
+def binaries_load(cache_dir, release):
+    url = snapshot_url(release, 'rpm.list')
+    return request_cached(url, cache_dir, TTL_NEVER).strip().splitlines()
+
+def binary_ids(binaries):
+    """Hash binaries to sorted unique 64-bit IDs.
+
+    String hashes are randomized per process so IDs are only comparable within
+    a process which suffices since predecessors are hashed again each run.
+    """
+    return np.unique(np.fromiter(map(hash, binaries), dtype=np.int64, count=len(binaries)))
+
+def list_detail_download(cache_dir, releases):
+    """Download and parse release details.
 
+    Releases are fetched by a pool of workers ahead of parsing which proceeds
+    in release order. Yields (release, details) pairs of available releases.
+    """
+    binary_regex = re.compile(BINARY_REGEX)
+    binary_gcc_regex = re.compile(BINARY_INTEREST_GCC)
+    fetched = prefetch_ordered(lambda release: release_fetch(cache_dir, release),
+                               releases, SNAPSHOT_WORKERS, SNAPSHOT_PREFETCH)
+    for release, lists in fetched:
+        if lists is None:
             continue
 
+        disk, binaries, binaries_unique = lists
+        details_release = {}
+
         details_release['disk_base'] = sizeof_fmt(int(disk[0].split('\t')[0]))
         details_release['binary_unique_count'] = int(disk[1].split(' ')[0])
         details_release['disk_shared'] = 'unknown'
-
-        url = snapshot_url(release, 'rpm.list')
-        binaries = request_cached(url, cache_dir, ttl_never).strip().splitlines()
         details_release['binary_count'] = len(binaries)
 
         binary_interest = {}
@@ -121,20 +227,89 @@ def list_detail_download(cache_dir, releases):
 
         details_release['binary_interest'] = binary_interest
 
-        url = snapshot_url(release, 'rpm.unique.list')
-        binaries = request_cached(url, cache_dir, ttl_never).strip().splitlines()
-
         binary_interest_changed = set()
-        for binary in binaries:
+        for binary in binaries_unique:
             binary_match = binary_regex.match(path.basename(binary))
             if binary_match and binary_match.group('name') in binary_interest:
                 binary_interest_changed.add(binary_match.group('name'))
 
         details_release['binary_interest_changed'] = list(sorted(binary_interest_changed))
 
+        yield release, details_release
+
+def list_detail_update(cache_dir, releases, details, queue):
+    """Add details of releases listed since the last run or still pending.
+
+    The queue holds the latest release previously listed and the releases
+    which were not yet available. It is the only source of retries, so a
+    release is fetched once when first listed and then only while pending.
+    Pending releases older than PENDING_MAX_AGE are given up on. Releases no
+    longer listed are dropped. Returns the queue for the next run.
+    """
+    latest = queue.get('latest')
+    listed = set(releases)
+    pending = [release for release in queue.get('pending', []) if release in listed and release not in details]
+    releases_new = [release for release in releases
+                    if (latest is None or release > latest) and release not in details]
+    releases_fetch = sorted(set(releases_new + pending))
+    logger.debug('fetching details for %d releases (%d pending)', len(releases_fetch), len(pending))
+
+    for release in set(details) - set(releases):
+        del details[release]
+
+    for release, details_release in list_detail_download(cache_dir, releases_fetch):
         details[release] = details_release
 
-    return details
+        if release in pending:
+            # Successor was compared against an earlier release in the meantime.
+            for successor in releases[releases.index(release) + 1:]:
+                if successor in details:
+                    details[successor].pop('binary_shared_count', None)
+                    break
+
+    today = date.today()
+    pending = []
+    for release in releases_fetch:
+        if release in details:
+            continue
+        if today - release_to_date(release) > PENDING_MAX_AGE:
+            logger.info('giving up on details for %s', release)
+            continue
+        pending.append(release)
+
+    if releases and (latest is None or max(releases) > latest):
+        latest = max(releases)
+
+    return {
+        'latest': latest,
+        'pending': pending,
+    }
+
+def binaries_shared_update(cache_dir, releases, details, limit=SHARED_BACKFILL):
+    """Count binaries shared with the preceding available release where missing.
+
+    At most the newest limit releases lacking the count are processed, oldest
+    first, such that new releases are handled right away while history is
+    backfilled over subsequent runs. Only the IDs of the previous release are
+    kept so each release costs a single merge.
+    """
+    available = [release for release in releases if release in details]
+    targets = [index for index, release in enumerate(available)
+               if index and 'binary_shared_count' not in details[release]][-limit:]
+    logger.debug('counting shared binaries for %d releases', len(targets))
+
+    release_previous, ids_previous = None, None
+    for index in targets:
+        release, predecessor = available[index], available[index - 1]
+        if predecessor != release_previous:
+            ids_previous = binary_ids(binaries_load(cache_dir, predecessor))
+
+        ids = binary_ids(binaries_load(cache_dir, release))
+        shared = np.intersect1d(ids, ids_previous, assume_unique=True).size
+        details[release]['binary_shared_count'] = shared
+        details[release]['disk_shared'] = '{:.1f}%'.format(100 * shared / max(ids.size, 1))
+
+        release_previous, ids_previous = release, ids
 
 def main(logger_, cache_dir, data_dir):
     global logger
@@ -144,10 +319,13 @@ def main(logger_, cache_dir, data_dir):
     ensure_directory(data_dir)
 
     releases = list_download(cache_dir)
-    details = list_detail_download(cache_dir, releases)
+    details = yaml_load(data_dir, 'snapshot.yaml') or {}
+    queue = list_detail_update(cache_dir, releases, details, yaml_load(cache_dir, PENDING_NAME) or {})
+    yaml_write(cache_dir, PENDING_NAME, queue)
+    binaries_shared_update(cache_dir, releases, details)
 
-    with open(path.join(data_dir, 'snapshot.yaml'), 'w') as outfile:
-        yaml.safe_dump(details, outfile, default_flow_style=False)
+    if not yaml_write(data_dir, 'snapshot.yaml', iter(sorted(details.items()))):
+        logger.debug('snapshot details unchanged')
 
 def argparse_main(args):
     cache_dir = path.join(args.cache_dir, 'snapshot')
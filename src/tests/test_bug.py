@@ -0,0 +1,55 @@
+from bug import bug_release_associate
+from copy import deepcopy
+import unittest
+
+RELEASES = ['20200110', '20200102', '20200105']
+
+def bug_make(bug_id, create_time, **kwargs):
+    return dict(id=bug_id, create_time=create_time, **kwargs)
+
+class TestBugReleaseAssociate(unittest.TestCase):
+    def test_unsorted(self):
+        bugs = [
+            bug_make(3, '20200111T08:00:00'),
+            bug_make(1, '20200103T08:00:00'),
+            bug_make(2, '20200106T08:00:00'),
+            bug_make(4, '20200104T08:00:00'),
+        ]
+        bugs_release = bug_release_associate(bugs, RELEASES)
+
+        self.assertEqual(list(bugs_release), sorted(RELEASES))
+        self.assertEqual([bug['id'] for bug in bugs_release['20200102']], [1, 4])
+        self.assertEqual([bug['id'] for bug in bugs_release['20200105']], [2])
+        self.assertEqual([bug['id'] for bug in bugs_release['20200110']], [3])
+
+    def test_release_day(self):
+        bugs = [bug_make(1, '2020-01-05 00:00:01'), bug_make(2, '20200104T23:59:59')]
+        bugs_release = bug_release_associate(bugs, RELEASES)
+
+        self.assertEqual([bug['id'] for bug in bugs_release['20200105']], [1])
+        self.assertEqual([bug['id'] for bug in bugs_release['20200102']], [2])
+
+    def test_before_first_release(self):
+        bugs = [bug_make(1, '20200101T12:00:00')]
+        bugs_release = bug_release_associate(bugs, RELEASES)
+
+        self.assertEqual(bugs_release, {release: [] for release in RELEASES})
+
+    def test_incremental(self):
+        bugs = {
+            1: bug_make(1, '20200103T08:00:00'),
+            2: bug_make(2, '20200106T08:00:00', releases_mentioned=['20200102']),
+            3: bug_make(3, '20200111T08:00:00'),
+        }
+        bugs_release = bug_release_associate(deepcopy(list(bugs.values())), RELEASES)
+
+        # Bug moves to a new release, gains a mention, and a new bug appears.
+        bugs_changed = [
+            bug_make(1, '20200106T08:00:00'),
+            bug_make(3, '20200111T08:00:00', releases_mentioned=['20200105']),
+            bug_make(4, '20200101T08:00:00'),
+        ]
+        bugs.update((bug['id'], bug) for bug in bugs_changed)
+
+        self.assertEqual(bug_release_associate(deepcopy(bugs_changed), RELEASES, bugs_release),
+                         bug_release_associate(deepcopy(list(bugs.values())), RELEASES))
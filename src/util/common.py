@@ -1,18 +1,26 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 from datetime import datetime
 from datetime import timedelta
+from hashlib import sha1
 import os
 from os import path
 import requests
 import shutil
+import tempfile
 from urllib.parse import urlparse
 import yaml
 
 CACHE_ROOT_DIR = 'tumbleweed-review'
 
+# Paths of files written with different content since last reported.
+FILES_CHANGED = []
+
 def ensure_directory(directory):
     if not path.isdir(directory):
-        os.makedirs(directory)
+        # Tolerate creation by another thread in the meantime.
+        os.makedirs(directory, exist_ok=True)
 
 def jekyll_init(site_dir):
     from main import ROOT_PATH
@@ -84,6 +92,22 @@ def request_cached(url, cache_dir, ttl=timedelta(hours=1)):
 
     return response.text
 
+def prefetch_ordered(function, items, workers=4, lookahead=8):
+    """Apply function to items using a pool of workers yielding results in order.
+
+    No more than lookahead results are pending at once so the workers remain
+    a bounded distance ahead of the consumer.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= lookahead:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
 def release_parts(release):
     return release[0:4], release[4:6], release[6:8]
 
@@ -97,3 +121,76 @@ def yaml_load(data_dir, name):
             return yaml.safe_load(handle)
 
     return None
+
+def file_digest(file_path):
+    digest = sha1()
+    with open(file_path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(chunk)
+
+    return digest.digest()
+
+def file_write(file_path, content):
+    """Atomically replace file with content unless unchanged.
+
+    Content may be bytes or an iterable of bytes written as produced. It is
+    synced to a temporary file alongside which is then renamed over the file
+    so readers never observe partial content. Returns True if written.
+    """
+    if isinstance(content, bytes):
+        content = [content]
+
+    digest = sha1()
+    handle, temp_path = tempfile.mkstemp(dir=path.dirname(file_path) or '.', prefix='.' + path.basename(file_path))
+    try:
+        with os.fdopen(handle, 'wb') as temp_handle:
+            for chunk in content:
+                digest.update(chunk)
+                temp_handle.write(chunk)
+
+            if path.exists(file_path) and file_digest(file_path) == digest.digest():
+                os.remove(temp_path)
+                return False
+
+            temp_handle.flush()
+            os.fsync(temp_handle.fileno())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    FILES_CHANGED.append(file_path)
+    return True
+
+def files_changed_report(logger):
+    """Log and clear files changed since the previous report."""
+    if FILES_CHANGED:
+        logger.info('changed %d files', len(FILES_CHANGED))
+        for file_path in FILES_CHANGED:
+            logger.debug('changed %s', file_path)
+    FILES_CHANGED.clear()
+
+def yaml_stream(pairs):
+    """Serialize (key, value) pairs as a mapping one key at a time."""
+    empty = True
+    for key, value in pairs:
+        empty = False
+        yield yaml.safe_dump({key: value}, default_flow_style=False, sort_keys=True).encode('utf-8')
+
+    if empty:
+        yield yaml.safe_dump({}).encode('utf-8')
+
+def yaml_write(data_dir, name, data):
+    """Serialize with sorted keys and write unless unchanged, see file_write().
+
+    Data may also be an iterator of (key, value) pairs of a mapping which are
+    written as they arrive in the order given.
+    """
+    if isinstance(data, (dict, list)):
+        content = yaml.safe_dump(data, default_flow_style=False, sort_keys=True).encode('utf-8')
+    else:
+        content = yaml_stream(data)
+
+    return file_write(path.join(data_dir, name), content)
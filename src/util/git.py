@@ -2,6 +2,8 @@ import os
 from os import path
 import subprocess
 
+GIT_SYNC_URL = 'https://github.com/simonthum/git-sync.git'
+
 def clone(url, directory):
     return_code = subprocess.call(['git', 'clone', url, directory])
     if return_code != 0:
@@ -16,7 +18,7 @@ def sync(cache_dir, repo_url, message=None):
     git_sync_exec = os.path.join(git_sync_dir, 'git-sync')
     if not os.path.exists(git_sync_dir):
         os.makedirs(git_sync_dir)
-        clone('https://github.com/simonthum/git-sync.git', git_sync_dir)
+        clone(GIT_SYNC_URL, git_sync_dir)
     else:
         os.chdir(git_sync_dir)
         subprocess.call(['git', 'pull', 'origin', 'master'], stdout=devnull, stderr=devnull)
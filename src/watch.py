@@ -0,0 +1,252 @@
+import bug
+from copy import deepcopy
+from datetime import date
+from index import index_publish
+import mail
+import markdown
+from os import path
+import random
+import score
+import signal
+import snapshot
+import threading
+from util.common import ensure_directory
+from util.common import files_changed_report
+from util.common import yaml_load
+from util.common import yaml_write
+from util.git import sync
+
+WATCH_BACKOFF_MIN = 60
+WATCH_BACKOFF_MAX = 6 * 60 * 60
+WATCH_JITTER = 0.1
+DATA_NAMES = ['bug', 'mail', 'score', 'snapshot']
+
+def releases_changed(previous, current):
+    """Determine releases whose data differs from previous."""
+    return set(release for release in current if previous.get(release) != current[release])
+
+def state_init(config):
+    """Build in-memory state from scratch, reusing caches where available."""
+    logger.info('building state')
+    state = {
+        'bug_api': bug.bugzilla_init(config['bugzilla_apiurl']),
+        'bug_release': {},
+        'bug_since': None,
+        'bugs': {},
+        'chain': yaml_load(config['score_dir'], 'chain.yaml') or {},
+        'counts': {},
+        'data': {},
+        'links': markdown.links_load(config['markdown_dir']),
+        'mail': {},
+        'mail_month': config['mail_start_month'],
+        'score': yaml_load(config['data_dir'], 'score.yaml') or {},
+        'snapshot': yaml_load(config['data_dir'], 'snapshot.yaml') or {},
+        'snapshot_queue': yaml_load(config['snapshot_dir'], snapshot.PENDING_NAME) or {},
+        'tree': None,
+    }
+
+    # Output as previously written determines what must be regenerated.
+    for name in DATA_NAMES:
+        state['data'][name] = yaml_load(config['data_dir'], '{}.yaml'.format(name)) or {}
+
+    return state
+
+def mail_update(state, config):
+    """Process new messages from mboxes of months since the last poll."""
+    mbox_paths = mail.mboxes_download(config['mbox_dir'], state['mail_month'])
+    state['tree'] = mail.mboxes_process(mbox_paths, state['tree'], state['counts'], config['scan_bodies'])
+    state['mail_month'] = date.today().replace(day=1)
+
+    root, lookup, releases = state['tree']
+    discussions = mail.discussions_find(root, lookup, releases)
+    candidates = mail.discussions_candidates(root, releases, discussions) if config['scan_bodies'] else None
+    discussions = mail.discussions_reduce(discussions, config['fuzzy_threshold'])
+    state['mail'] = dict(mail.discussions_export(lookup, releases, discussions, candidates))
+
+def snapshot_update(state, config):
+    """Fetch details of releases new or pending since the last poll."""
+    releases = snapshot.list_download(config['snapshot_dir'])
+    state['snapshot_queue'] = snapshot.list_detail_update(
+        config['snapshot_dir'], releases, state['snapshot'], state['snapshot_queue'])
+    yaml_write(config['snapshot_dir'], snapshot.PENDING_NAME, state['snapshot_queue'])
+    snapshot.binaries_shared_update(config['snapshot_dir'], releases, state['snapshot'])
+
+def bug_update(state, config):
+    """Fetch bugs changed since the last poll and re-associate them."""
+    poll_date = date.today()
+    bugs, last_change_times = bug.bugs_fetch(state['bug_api'], config['bug_start_month'], state['bug_since'])
+    logger.debug('fetched %d changed bugs', len(bugs))
+
+    if config['scan_comments']:
+        bug.comments_scan(state['bug_api'], config['bug_dir'], bugs, last_change_times, state['mail'])
+
+    bugs_changed = bug.bug_cache_diff(state['bugs'], bugs)
+    state['bugs'].update(bugs)
+
+    if set(state['bug_release']) != set(state['mail']):
+        state['bug_release'] = bug.bug_release_associate(state['bugs'].values(), state['mail'])
+    elif bugs_changed:
+        state['bug_release'] = bug.bug_release_associate(bugs_changed, state['mail'], state['bug_release'])
+
+    if bugs_changed:
+        yaml_write(config['bug_dir'], 'bug.yaml', state['bugs'])
+
+    # Only advance once applied so a failed poll fetches the same changes again.
+    state['bug_since'] = poll_date
+
+def score_update(state, config):
+    state['chain'], state['score'] = score.score_incremental(
+        state['bug_release'], state['mail'], state['snapshot'], state['chain'], state['score'])
+
+    yaml_write(config['score_dir'], 'chain.yaml', state['chain'])
+
+def output_update(state, config):
+    """Write changed data and regenerate posts of affected releases.
+
+    Returns True if any output was written.
+    """
+    data = {
+        'bug': state['bug_release'],
+        'mail': state['mail'],
+        'score': state['score'],
+        'snapshot': state['snapshot'],
+    }
+
+    affected = set()
+    written = False
+    for name in DATA_NAMES:
+        if data[name] == state['data'][name]:
+            continue
+
+        affected.update(releases_changed(state['data'][name], data[name]))
+        if yaml_write(config['data_dir'], '{}.yaml'.format(name), iter(sorted(data[name].items()))):
+            written = True
+            logger.info('wrote %s.yaml', name)
+        state['data'][name] = deepcopy(data[name])
+
+        if name == 'score':
+            index_publish(path.join(config['data_dir'], 'index'), state['score'])
+
+    affected.intersection_update(state['mail'])
+    if not affected:
+        return written
+
+    logger.info('regenerating %d posts', len(affected))
+
+    mail_affected = {release: state['mail'][release] for release in sorted(affected)}
+    links_new = markdown.posts_build(config['posts_dir'], state['bug_release'], mail_affected,
+                                     state['score'], state['snapshot'], state['links'], config['jobs'])
+    if links_new:
+        state['links'].update(links_new)
+        markdown.links_save(config['markdown_dir'], state['links'])
+
+    markdown.releases_build(path.join(config['site_dir'], '_data'), path.join(config['site_dir'], 'releases'),
+                            state['bug_release'], state['mail'], state['score'], state['snapshot'])
+
+    return True
+
+def watch_poll(state, config):
+    """Apply changes from each source incrementally and sync any output."""
+    mail_update(state, config)
+    snapshot_update(state, config)
+    bug_update(state, config)
+    score_update(state, config)
+
+    if output_update(state, config) and config['repo_url']:
+        sync(config['cache_dir'], config['repo_url'])
+
+    files_changed_report(logger)
+
+def watch_signals(events):
+    """Stop on SIGTERM or SIGINT and rebuild state on SIGHUP."""
+    def stop(signum, frame):
+        logger.info('stopping after current poll')
+        events['stop'].set()
+        events['wake'].set()
+
+    def reload(signum, frame):
+        logger.info('rebuilding state on next poll')
+        events['reload'].set()
+        events['wake'].set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+def watch_delay(interval, failures):
+    """Delay until next poll with jitter and exponential backoff on failure."""
+    if failures:
+        delay = min(WATCH_BACKOFF_MIN * 2 ** (failures - 1), WATCH_BACKOFF_MAX)
+    else:
+        delay = interval
+
+    return delay * random.uniform(1 - WATCH_JITTER, 1 + WATCH_JITTER)
+
+def main(logger_, config):
+    global logger
+    logger = logger_
+    for module in [bug, mail, markdown, score, snapshot]:
+        module.logger = logger
+
+    for directory in ['bug_dir', 'data_dir', 'markdown_dir', 'mbox_dir', 'posts_dir', 'score_dir', 'snapshot_dir']:
+        ensure_directory(config[directory])
+
+    events = {name: threading.Event() for name in ['reload', 'stop', 'wake']}
+    watch_signals(events)
+
+    state = None
+    failures = 0
+    while not events['stop'].is_set():
+        try:
+            if state is None or events['reload'].is_set():
+                events['reload'].clear()
+                state = state_init(config)
+
+            watch_poll(state, config)
+            failures = 0
+        except Exception:
+            failures += 1
+            logger.exception('poll failed (%d consecutive)', failures)
+
+        delay = watch_delay(config['interval'], failures)
+        logger.debug('next poll in %d seconds', delay)
+        events['wake'].wait(delay)
+        events['wake'].clear()
+
+    return 0
+
+def argparse_main(args):
+    config = {
+        'bug_dir': path.join(args.cache_dir, 'bug'),
+        'bug_start_month': args.bug_start_month,
+        'bugzilla_apiurl': args.bugzilla_apiurl,
+        'cache_dir': args.cache_dir,
+        'data_dir': path.join(args.output_dir, 'data'),
+        'fuzzy_threshold': args.fuzzy_threshold,
+        'interval': args.interval,
+        'jobs': args.jobs,
+        'mail_start_month': args.start_month,
+        'markdown_dir': path.join(args.cache_dir, 'markdown'),
+        'mbox_dir': path.join(args.cache_dir, 'mbox'),
+        'posts_dir': path.join(args.output_dir, '_posts'),
+        'repo_url': args.repo_url,
+        'scan_bodies': args.scan_bodies,
+        'scan_comments': args.scan_comments,
+        'score_dir': path.join(args.cache_dir, 'score'),
+        'site_dir': args.output_dir,
+        'snapshot_dir': path.join(args.cache_dir, 'snapshot'),
+    }
+    return main(args.logger, config)
+
+def argparse_configure(subparsers):
+    parser = subparsers.add_parser(
+        'watch',
+        help='Continuously ingest, score, and regenerate changed releases.')
+    parser.set_defaults(func=argparse_main)
+    bug.argparse_arguments(parser, ('--bug-start-month',))
+    parser.add_argument('-i', '--interval',
+                        type=int,
+                        default=60 * 60,
+                        help='seconds between polls')
+    mail.argparse_arguments(parser, refresh_optional=False)
+    markdown.argparse_arguments(parser)